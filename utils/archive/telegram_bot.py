@@ -12,6 +12,7 @@ from telegram.ext import (Application, CommandHandler, ContextTypes,
 from db.db_postgres import get_db_connection
 from lib.raydium import format_market_cap, get_token_price
 from sentiment_analysis.core import SentimentAnalyzer
+from sentiment_analysis.client import ScoringClient
 
 # Add these constants near the top of your file with other configurations
 IMAGES_FOLDER = "/static/images/quack"  # Replace with your actual images folder path
@@ -36,7 +37,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-sentiment_analyzer = SentimentAnalyzer()
+# Score through the shared sentiment service when one is configured
+sentiment_analyzer = ScoringClient() if os.getenv('SENTIMENT_SERVICE_URL') else SentimentAnalyzer()
 
 
 async def save_message_to_db(message: Update, chat_id: int) -> None:
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Optional
+
+import aiohttp
+from openai import APIStatusError, AsyncOpenAI, RateLimitError
+
+from lib.ollama import get_ollama_client
+from sentiment_analysis.rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class BackendRateLimitError(Exception):
+    """Raised by a backend when the provider answered 429."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BackendRequestError(Exception):
+    """Raised by a backend when the provider rejected the request itself.
+
+    Bad request, payload too large, content filter: sending the same input again
+    fails the same way, unlike rate limits, timeouts or server errors.
+    """
+
+
+# Statuses that reject the input rather than signal a provider or configuration problem
+REJECTED_REQUEST_STATUSES = {400, 413, 422}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class SentimentBackend:
+    """A model that turns a (system prompt, user content) pair into a completion string."""
+
+    name = 'base'
+
+    def __init__(self, model: str):
+        self.model = model
+        # Provider-reported token usage, summed over all requests
+        self.usage = {'requests': 0, 'prompt_tokens': 0, 'cached_prompt_tokens': 0, 'completion_tokens': 0}
+
+    def record_usage(self, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0):
+        self.usage['requests'] += 1
+        self.usage['prompt_tokens'] += prompt_tokens
+        self.usage['cached_prompt_tokens'] += cached_prompt_tokens
+        self.usage['completion_tokens'] += completion_tokens
+        logger.debug(
+            f"{self.name} request: {prompt_tokens} prompt tokens ({cached_prompt_tokens} cached), "
+            f"{completion_tokens} completion tokens"
+        )
+
+    async def complete(self, system_prompt: str, content: str, max_tokens: int) -> str:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class OpenAIBackend(SentimentBackend):
+    name = 'openai'
+
+    def __init__(self, model: str = 'gpt-3.5-turbo', base_url: Optional[str] = None,
+                 max_retries: int = 0, prompt_cache_key: Optional[str] = 'ducky-sentiment'):
+        super().__init__(model)
+        # No SDK-level retries: every 429 must reach the shared RateLimiter, which backs off all workers
+        self.client = AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            base_url=base_url,
+            max_retries=max_retries
+        )
+        # Routes requests sharing the system prompt to the same prompt cache
+        self.prompt_cache_key = prompt_cache_key
+
+    async def complete(self, system_prompt: str, content: str, max_tokens: int) -> str:
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": content}
+                ],
+                temperature=0,
+                max_tokens=max_tokens,
+                extra_body={"prompt_cache_key": self.prompt_cache_key} if self.prompt_cache_key else None
+            )
+        except RateLimitError as e:
+            error_response = getattr(e, 'response', None)
+            retry_after = error_response.headers.get('retry-after') if error_response is not None else None
+            raise BackendRateLimitError(str(e), parse_retry_after(retry_after)) from e
+        except APIStatusError as e:
+            if e.status_code in REJECTED_REQUEST_STATUSES:
+                raise BackendRequestError(str(e)) from e
+            raise
+
+        usage = response.usage
+        if usage:
+            details = getattr(usage, 'prompt_tokens_details', None)
+            self.record_usage(
+                usage.prompt_tokens, usage.completion_tokens,
+                getattr(details, 'cached_tokens', 0) or 0
+            )
+        return response.choices[0].message.content.strip()
+
+
+class OllamaBackend(SentimentBackend):
+    """Self-hosted model served by Ollama's /api/generate (see lib/ollama.py)."""
+
+    name = 'ollama'
+
+    def __init__(self, model: str = 'llama3.1:8b', base_url: Optional[str] = None,
+                 keep_alive: str = '30m'):
+        super().__init__(model)
+        self.url = f"{base_url or get_ollama_client()}/api/generate"
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Keeps the model, and the KV cache of the shared system prompt, loaded between requests
+        self.keep_alive = keep_alive
+
+    async def complete(self, system_prompt: str, content: str, max_tokens: int) -> str:
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        payload = {
+            "model": self.model,
+            "system": system_prompt,
+            "prompt": content,
+            "stream": False,
+            "format": "json",
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": 0,
+                "num_predict": max_tokens
+            }
+        }
+        async with self.session.post(self.url, json=payload) as response:
+            if response.status == 429:
+                raise BackendRateLimitError(
+                    "Ollama rate limited", parse_retry_after(response.headers.get('Retry-After'))
+                )
+            if response.status in REJECTED_REQUEST_STATUSES:
+                raise BackendRequestError(
+                    f"Ollama rejected the request: {response.status} {await response.text()}"
+                )
+            response.raise_for_status()
+            response_json = await response.json()
+            self.record_usage(response_json.get('prompt_eval_count', 0), response_json.get('eval_count', 0))
+            return response_json.get('response', '').strip()
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+
+def stub_scores(text: str) -> dict:
+    """Deterministic pseudo-scores derived from the text hash."""
+    digest = hashlib.sha256(text.encode('utf-8')).digest()
+    return {
+        key: round(digest[index] / 255, 2)
+        for index, key in enumerate(('positive', 'negative', 'helpful', 'sarcastic'))
+    }
+
+
+def stub_completion(content: str) -> str:
+    """Answer a single or batched scoring request with deterministic scores."""
+    try:
+        messages = json.loads(content)
+    except ValueError:
+        messages = None
+    if isinstance(messages, list):
+        return json.dumps([
+            {"id": message.get("id"), **stub_scores(str(message.get("text", "")))}
+            for message in messages
+            if isinstance(message, dict)
+        ])
+    return json.dumps(stub_scores(content))
+
+
+class StubBackend(SentimentBackend):
+    """Offline backend returning deterministic scores, for throughput tests without network access."""
+
+    name = 'stub'
+
+    def __init__(self, model: str = 'stub', latency: float = 0.0):
+        super().__init__(model)
+        self.latency = latency
+
+    async def complete(self, system_prompt: str, content: str, max_tokens: int) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        completion = stub_completion(content)
+        self.record_usage(estimate_tokens(system_prompt) + estimate_tokens(content), estimate_tokens(completion))
+        return completion
+
+
+BACKENDS = {
+    OpenAIBackend.name: OpenAIBackend,
+    OllamaBackend.name: OllamaBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def get_backend(name: Optional[str] = None, model: Optional[str] = None) -> SentimentBackend:
+    """Build a backend by name, defaulting to SENTIMENT_BACKEND / SENTIMENT_MODEL from the environment."""
+    name = name or os.getenv('SENTIMENT_BACKEND', OpenAIBackend.name)
+    model = model or os.getenv('SENTIMENT_MODEL')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown sentiment backend '{name}', expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](model) if model else BACKENDS[name]()
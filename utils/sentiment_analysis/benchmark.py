@@ -0,0 +1,253 @@
+"""Throughput benchmark for the sentiment pipeline.
+
+Seeds a local Postgres telegram_messages table with synthetic rows, serves an
+OpenAI-compatible fake completion endpoint with configurable latency and error
+rates, drains the backlog with SentimentAnalyzer and prints a JSON report.
+
+    python -m sentiment_analysis.benchmark --rows 5000 --concurrency 16 --output report.json
+
+Only run this against a disposable database: the analyzer claims every
+unanalyzed row in telegram_messages, not just the synthetic ones.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from aiohttp import web
+from psycopg2.extras import execute_values
+
+from db.db_postgres import get_db_connection
+from sentiment_analysis.backends import OpenAIBackend, SentimentBackend, stub_completion
+from sentiment_analysis.core import SentimentAnalyzer, setup_database
+from sentiment_analysis.sources import TELEGRAM_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_CHAT_ID = -4242
+WORDS = ['duck', 'chart', 'moon', 'pump', 'team', 'launch', 'wallet', 'price', 'community',
+         'bullish', 'dev', 'roadmap', 'listing', 'volume', 'holders', 'raid', 'quack', 'today']
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class FakeCompletionServer:
+    """Minimal /v1/chat/completions endpoint answering with deterministic stub scores."""
+
+    def __init__(self, latency: float, jitter: float, rate_limit_rate: float, malformed_rate: float,
+                 port: int = 8765):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.port = port
+        self.runner = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def handle_completion(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+        if random.random() < self.rate_limit_rate:
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                status=429, headers={"Retry-After": "0.5"}
+            )
+
+        content = body['messages'][-1]['content']
+        completion = "not json" if random.random() < self.malformed_rate else stub_completion(content)
+        return web.json_response({
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model', 'fake'),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": completion},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.handle_completion)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', self.port).start()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+class TimedBackend(SentimentBackend):
+    """Wraps a backend and records the latency of every completion."""
+
+    def __init__(self, backend: SentimentBackend):
+        super().__init__(backend.model)
+        self.backend = backend
+        self.latencies: List[float] = []
+
+    async def complete(self, system_prompt: str, content: str, max_tokens: int) -> str:
+        started = time.perf_counter()
+        try:
+            return await self.backend.complete(system_prompt, content, max_tokens)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+def seed_messages(conn, rows: int, duplicate_rate: float):
+    """Replace the synthetic benchmark chat with `rows` fresh unanalyzed messages."""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM telegram_messages WHERE chat_id = %s", (BENCHMARK_CHAT_ID,))
+    now = datetime.utcnow()
+    values = []
+    for message_id in range(1, rows + 1):
+        if values and random.random() < duplicate_rate:
+            content = random.choice(values)[2]
+        else:
+            content = f"{message_id} " + ' '.join(random.choices(WORDS, k=random.randint(4, 20)))
+        values.append((message_id, BENCHMARK_CHAT_ID, content, now - timedelta(seconds=message_id)))
+    execute_values(cursor, """
+        INSERT INTO telegram_messages (message_id, chat_id, content, timestamp)
+        VALUES %s
+    """, values, page_size=1000)
+    conn.commit()
+    cursor.close()
+
+
+def cleanup_messages(conn):
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM telegram_messages WHERE chat_id = %s", (BENCHMARK_CHAT_ID,))
+    conn.commit()
+    cursor.close()
+
+
+async def run_benchmark(args) -> Dict:
+    server = FakeCompletionServer(args.latency, args.jitter, args.rate_limit_rate, args.malformed_rate,
+                                  port=args.port)
+    await server.start()
+    backend = TimedBackend(OpenAIBackend(base_url=server.base_url, max_retries=0))
+    conn = get_db_connection()
+    try:
+        setup_database(conn)
+        seed_messages(conn, args.rows, args.duplicate_rate)
+
+        analyzer = SentimentAnalyzer(
+            backend=backend,
+            score_batch_size=args.score_batch_size,
+            max_concurrency=args.concurrency,
+            requests_per_minute=args.requests_per_minute,
+            tokens_per_minute=args.tokens_per_minute
+        )
+
+        claim_time = write_time = 0.0
+        scored_count = 0
+        started = time.perf_counter()
+        while True:
+            step = time.perf_counter()
+            messages = analyzer.claim_messages(conn, TELEGRAM_MESSAGES, args.batch_size)
+            claim_time += time.perf_counter() - step
+            if not messages:
+                break
+
+            scored = await analyzer.score_messages(messages, conn)
+            scored_count += len(scored)
+
+            step = time.perf_counter()
+            if args.write_strategy == 'bulk':
+                analyzer.write_scores(conn, TELEGRAM_MESSAGES, scored)
+            else:
+                analyzer.write_scores_per_row(conn, TELEGRAM_MESSAGES, scored)
+            write_time += time.perf_counter() - step
+
+            if len(scored) < len(messages):
+                # Unscored rows stay leased, so they aren't reclaimed before the run ends
+                logger.warning(f"{len(messages) - len(scored)} messages could not be scored")
+        elapsed = time.perf_counter() - started
+
+        if not args.keep:
+            cleanup_messages(conn)
+    finally:
+        conn.close()
+        await backend.backend.close()
+        await server.stop()
+
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": vars(args),
+        "messages": scored_count,
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_sec": round(scored_count / elapsed, 2) if elapsed else None,
+        "requests": len(backend.latencies),
+        "request_latency_ms": {
+            "p50": round(percentile(backend.latencies, 50) * 1000, 1),
+            "p95": round(percentile(backend.latencies, 95) * 1000, 1),
+            "max": round(max(backend.latencies, default=0) * 1000, 1),
+        },
+        "db_time_s": {
+            "claim": round(claim_time, 3),
+            "write": round(write_time, 3),
+            "total": round(claim_time + write_time, 3),
+        },
+        "cache": analyzer.cache.stats(),
+        "fast_path": analyzer.fast_path_count,
+        "local_head": analyzer.local_head_count,
+        "cascade": analyzer.escalation_stats(),
+        "tokens": {
+            "requests": analyzer.request_builder.stats(),
+            "usage": backend.backend.usage,
+        },
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark sentiment backlog throughput")
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=200, help="rows claimed per batch")
+    parser.add_argument('--score-batch-size', type=int, default=20, help="messages per model request")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests-per-minute', type=int, default=100000)
+    parser.add_argument('--tokens-per-minute', type=int, default=100000000)
+    parser.add_argument('--write-strategy', choices=['bulk', 'row'], default='bulk')
+    parser.add_argument('--latency', type=float, default=0.3, help="fake server latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help="fraction of replies that are not JSON")
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help="fraction of seeded rows that repeat earlier text")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep', action='store_true', help="keep the seeded rows afterwards")
+    parser.add_argument('--output', help="also write the JSON report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    if os.getenv('RAILWAY_ENVIRONMENT_NAME') == 'production':
+        raise ValueError("Refusing to run the benchmark against the production database")
+
+    args = parse_args()
+    random.seed(args.seed)
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    logging.getLogger('sentiment_analysis.core').setLevel(logging.WARNING)
+
+    report = asyncio.run(run_benchmark(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
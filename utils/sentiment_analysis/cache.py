@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from psycopg2.extras import execute_values
+
+from sentiment_analysis.sources import WHITESPACE, Scores
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_CACHE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sentiment_cache (
+        content_hash TEXT PRIMARY KEY,
+        sentiment_positive FLOAT NOT NULL,
+        sentiment_negative FLOAT NOT NULL,
+        sentiment_helpful FLOAT NOT NULL,
+        sentiment_sarcastic FLOAT NOT NULL,
+        hit_count BIGINT NOT NULL DEFAULT 0,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+# Emoji presentation modifiers that don't change meaning: variation selectors,
+# skin tones and zero-width joiners.
+EMOJI_MODIFIERS = re.compile('[\ufe0e\ufe0f\u200d\U0001f3fb-\U0001f3ff]')
+# Runs of the same symbol ("🚀🚀🚀", "!!!!") collapse to a single one
+REPEATED_SYMBOLS = re.compile(r'([^\w\s])\1+')
+
+
+def normalize_content(text: str) -> str:
+    """Normalize message text so trivially different copies share a cache entry."""
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = EMOJI_MODIFIERS.sub('', text)
+    text = REPEATED_SYMBOLS.sub(r'\1', text)
+    return WHITESPACE.sub(' ', text).strip()
+
+
+def content_hash(text: str, namespace: str = '') -> str:
+    """Hash of the normalized text; a namespace (e.g. the model version) keeps entries apart."""
+    return hashlib.sha256(f"{namespace}\0{normalize_content(text)}".encode('utf-8')).hexdigest()
+
+
+class SentimentCache:
+    """Persistent content-hash -> scores cache backed by the sentiment_cache table.
+
+    A small in-process LRU sits in front of the table so hot copypasta never
+    leaves the process.
+    """
+
+    def __init__(self, memory_size: int = 10000):
+        self.memory: "OrderedDict[str, Scores]" = OrderedDict()
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, scores: Scores):
+        self.memory[key] = scores
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def lookup_many(self, conn, hashes: Iterable[str]) -> Dict[str, Scores]:
+        """Return cached scores for the given hashes, updating hit/miss counters.
+
+        Counters are per message, so duplicate hashes within one lookup each count.
+        """
+        hashes = list(hashes)
+        found = {key: self.memory[key] for key in set(hashes) if key in self.memory}
+        for key in found:
+            self.memory.move_to_end(key)
+
+        remaining = list(set(hashes) - found.keys())
+        if remaining:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    UPDATE sentiment_cache
+                    SET hit_count = hit_count + 1
+                    WHERE content_hash = ANY(%s)
+                    RETURNING content_hash, sentiment_positive, sentiment_negative,
+                              sentiment_helpful, sentiment_sarcastic
+                """, (remaining,))
+                for key, *scores in cursor.fetchall():
+                    found[key] = tuple(scores)
+                    self._remember(key, found[key])
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error reading sentiment cache: {str(e)}")
+                conn.rollback()
+            finally:
+                cursor.close()
+
+        hits = sum(1 for key in hashes if key in found)
+        self.hits += hits
+        self.misses += len(hashes) - hits
+        return found
+
+    def store_many(self, conn, scored: Dict[str, Scores]):
+        """Persist freshly computed scores."""
+        if not scored:
+            return
+        for key, scores in scored.items():
+            self._remember(key, scores)
+
+        cursor = conn.cursor()
+        try:
+            execute_values(cursor, """
+                INSERT INTO sentiment_cache (
+                    content_hash, sentiment_positive, sentiment_negative,
+                    sentiment_helpful, sentiment_sarcastic
+                ) VALUES %s
+                ON CONFLICT (content_hash) DO NOTHING
+            """, [(key, *scores) for key, scores in scored.items()])
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error writing sentiment cache: {str(e)}")
+            conn.rollback()
+        finally:
+            cursor.close()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else None,
+        }
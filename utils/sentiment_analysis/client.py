@@ -0,0 +1,54 @@
+import os
+from typing import List, Optional, Tuple
+
+import aiohttp
+
+from sentiment_analysis.sources import SENTIMENT_KEYS, Scores
+
+DEFAULT_SERVICE_URL = 'http://127.0.0.1:8790'
+
+
+def scores_from_json(value: Optional[dict]) -> Optional[Scores]:
+    return tuple(float(value[key]) for key in SENTIMENT_KEYS) if value else None
+
+
+class ScoringClient:
+    """Client for the scoring service, usable wherever a SentimentAnalyzer scored text inline."""
+
+    def __init__(self, base_url: Optional[str] = None, timeout: float = 120):
+        self.base_url = (base_url or os.getenv('SENTIMENT_SERVICE_URL', DEFAULT_SERVICE_URL)).rstrip('/')
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Version of the model behind the service, as of the last response
+        self.model_version: Optional[str] = None
+
+    async def _post(self, path: str, payload: dict) -> dict:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+        async with self.session.post(f"{self.base_url}{path}", json=payload) as response:
+            response.raise_for_status()
+            response_json = await response.json()
+        self.model_version = response_json.get('model_version', self.model_version)
+        return response_json
+
+    async def analyze_sentiment(self, text: str) -> Optional[Scores]:
+        if not text or not text.strip():
+            return None
+        response = await self._post('/score', {"text": text})
+        return scores_from_json(response['scores'])
+
+    async def score_texts(self, texts: List[str]) -> List[Optional[Scores]]:
+        return [scores for scores, _ in await self.score_texts_with_sources(texts)]
+
+    async def score_texts_with_sources(self, texts: List[str]) -> List[Tuple[Optional[Scores], Optional[str]]]:
+        """Scores for each text, with what produced them (see sentiment_score_source)."""
+        if not texts:
+            return []
+        response = await self._post('/score/batch', {"texts": texts})
+        score_sources = response.get('score_sources') or [None] * len(response['scores'])
+        return [(scores_from_json(scores), source) for scores, source in zip(response['scores'], score_sources)]
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
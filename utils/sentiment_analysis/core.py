@@ -1,15 +1,34 @@
 import asyncio
+import hashlib
 import json
 import logging
 import os
+import socket
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
 
 import psycopg2
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
 
 from db.db_postgres import get_db_connection
+from sentiment_analysis.backends import (BackendRateLimitError, BackendRequestError,
+                                         SentimentBackend, get_backend)
+from sentiment_analysis.cache import (SENTIMENT_CACHE_SCHEMA, SentimentCache,
+                                      content_hash)
+from sentiment_analysis.client import ScoringClient
+from sentiment_analysis.embeddings import EMBEDDING_SCHEMA
+from sentiment_analysis.fast_path import classify_trivial
+from sentiment_analysis.few_shot import ExampleIndex, load_example_index
+from sentiment_analysis.local_head import LocalScorer, load_local_scorer
+from sentiment_analysis.notify import NotificationListener
+from sentiment_analysis.priority import (PriorityClass, allocate_quotas,
+                                         default_priority_classes)
+from sentiment_analysis.rate_limiter import RateLimiter
+from sentiment_analysis.request_builder import RequestBuilder, SentimentRequest
+from sentiment_analysis.sources import (SCORE_SOURCE_CACHE, SCORE_SOURCE_FAST_PATH,
+                                        SCORE_SOURCE_MODEL, SENTIMENT_KEYS, SOURCES,
+                                        TELEGRAM_MESSAGES, Scores, SentimentSource)
 
 # Set up logging
 logging.basicConfig(
@@ -21,104 +40,697 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-class SentimentAnalyzer:
-    def __init__(self):
-        # OpenAI setup
-        self.client = AsyncOpenAI(
-            api_key=os.getenv('OPENAI_API_KEY')
-        )
-        
-
-    async def analyze_sentiment(self, text: str) -> Optional[Tuple[float, float, float, float]]:
-        """Analyze text sentiment using OpenAI."""
-        if not text or len(text.strip()) == 0:
-            return None
-            
-        try:
-            response = await self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": """
+SYSTEM_PROMPT = """
                     Analyze the sentiment of the following message and return a JSON object with these scores:
                     - positive (0-1): How positive the message is
                     - negative (0-1): How negative the message is
                     - helpful (0-1): How helpful/constructive the message is
                     - sarcastic (0-1): How sarcastic the message is
                     Only return the JSON object, nothing else.
-                    """},
-                    {"role": "user", "content": text}
-                ],
-                temperature=0,
-                max_tokens=100
-            )
-            
-            result = json.loads(response.choices[0].message.content.strip())
-            return (
-                result['positive'],
-                result['negative'],
-                result['helpful'],
-                result['sarcastic']
-            )
-            
+                    """
+
+BATCH_SYSTEM_PROMPT = """
+                    You will receive a JSON array of messages, each with an "id" and a "text".
+                    Analyze the sentiment of every message and return a JSON array with one object per message:
+                    {"id": <the message id>, "positive": 0-1, "negative": 0-1, "helpful": 0-1, "sarcastic": 0-1}
+                    - positive: How positive the message is
+                    - negative: How negative the message is
+                    - helpful: How helpful/constructive the message is
+                    - sarcastic: How sarcastic the message is
+                    Only return the JSON array, nothing else.
+                    """
+
+# A claimed row: (primary key tuple, text content)
+WorkItem = Tuple[tuple, str]
+
+
+def default_model_version(backend: SentimentBackend, escalation_backend: Optional[SentimentBackend] = None,
+                          example_index: Optional[ExampleIndex] = None, few_shot_k: int = 0) -> str:
+    """Identify what produced a score: the backend models plus a hash of the prompts.
+
+    Tuning SYSTEM_PROMPT / BATCH_SYSTEM_PROMPT, the few-shot examples, or switching
+    model changes the version, which marks earlier rows for re-scoring (see rescore.py).
+    """
+    models = f"{backend.name}:{backend.model}"
+    if escalation_backend:
+        models += f">{escalation_backend.name}:{escalation_backend.model}"
+    prompt_hash = hashlib.sha256((SYSTEM_PROMPT + BATCH_SYSTEM_PROMPT).encode('utf-8')).hexdigest()[:8]
+    if example_index and few_shot_k:
+        prompt_hash += f"+{few_shot_k}x{example_index.fingerprint}"
+    return f"{models}@{prompt_hash}"
+
+
+def parse_scores(result: dict) -> Optional[Scores]:
+    """Validate a score object returned by the model."""
+    try:
+        scores = tuple(float(result[key]) for key in SENTIMENT_KEYS)
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not all(0 <= score <= 1 for score in scores):
+        return None
+    return scores
+
+
+class SentimentAnalyzer:
+    def __init__(self, backend: Optional[SentimentBackend] = None, score_batch_size: int = 20,
+                 max_concurrency: int = 8, requests_per_minute: int = 3500,
+                 tokens_per_minute: int = 90000, max_rate_limit_retries: int = 5,
+                 lease_seconds: int = 300, max_attempts: int = 5,
+                 retry_base_seconds: float = 30, retry_max_seconds: float = 3600,
+                 outage_backoff_seconds: float = 5, outage_backoff_max_seconds: float = 300,
+                 sources: Optional[List[SentimentSource]] = None, live_window_seconds: int = 3600,
+                 bot_sender_ids: Sequence[int] = (),
+                 escalation_backend: Optional[SentimentBackend] = None,
+                 escalation_margin: float = 0.15, sarcasm_threshold: float = 0.5,
+                 model_version: Optional[str] = None, local_scorer: Optional[LocalScorer] = None,
+                 scoring_client: Optional[ScoringClient] = None, max_content_tokens: int = 256,
+                 example_index: Optional[ExampleIndex] = None, few_shot_k: int = 4):
+        # Model backend (OpenAI unless SENTIMENT_BACKEND says otherwise)
+        self.backend = backend or get_backend()
+        # Compact canonical prompts, normalized and length-capped content, per-request token counts
+        self.request_builder = RequestBuilder(
+            SYSTEM_PROMPT, BATCH_SYSTEM_PROMPT, max_content_tokens, example_index, few_shot_k
+        )
+        # Optional stronger model for a two-tier cascade: messages the first backend scores
+        # near the decision boundary, flags as sarcastic, or fails to score are re-scored by it
+        self.escalation_backend = escalation_backend
+        self.escalation_margin = escalation_margin
+        self.sarcasm_threshold = sarcasm_threshold
+        self.first_tier_count = 0
+        self.escalated_count = 0
+        # Embedding + ridge head that scores confidently-predicted messages without a model request
+        self.local_scorer = local_scorer
+        self.local_head_count = 0
+        # When set, scoring is delegated to the shared scoring service (see service.py)
+        self.scoring_client = scoring_client
+        # Stamped on every scored row; SENTIMENT_MODEL_VERSION pins it across deploys
+        self.model_version = (
+            model_version or os.getenv('SENTIMENT_MODEL_VERSION')
+            or default_model_version(self.backend, escalation_backend, example_index, few_shot_k)
+        )
+        # Number of messages packed into a single batched request
+        self.score_batch_size = score_batch_size
+        # Requests in flight are bounded by the semaphore and paced by the quota limiter
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_rate_limit_retries = max_rate_limit_retries
+        # Identical (normalized) messages are scored once and served from the cache afterwards
+        self.cache = SentimentCache()
+        # Messages scored locally by the fast path, never sent to the model
+        self.fast_path_count = 0
+        # Rows are leased to this worker while scored; an expired lease is picked up by another worker
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        # Messages that repeatedly fail to score are retried with exponential delays, then dead-lettered
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        # While the backend is unavailable the worker pauses, doubling the pause per consecutive failure
+        self.outage_backoff_seconds = outage_backoff_seconds
+        self.outage_backoff_max_seconds = outage_backoff_max_seconds
+        self.consecutive_outages = 0
+        # Tables scored by this engine; they share the cache, rate limiter and worker pool
+        self.sources = sources or [TELEGRAM_MESSAGES]
+        # Live rows are claimed ahead of backfill, each class with a guaranteed share of every batch
+        self.priority_classes: Dict[str, List[PriorityClass]] = {
+            source.table: default_priority_classes(source, live_window_seconds, bot_sender_ids)
+            for source in self.sources
+        }
+
+    async def _complete(self, request: SentimentRequest,
+                        backend: Optional[SentimentBackend] = None) -> str:
+        """Run one backend completion within the concurrency and rate limits, retrying on 429."""
+        backend = backend or self.backend
+        logger.debug(
+            f"Sentiment request: ~{request.prompt_tokens} prompt tokens "
+            f"(~{request.untrimmed_tokens} untrimmed), {request.max_tokens} max completion tokens"
+        )
+        for attempt in range(self.max_rate_limit_retries + 1):
+            await self.rate_limiter.acquire(request.total_tokens)
+            try:
+                async with self.semaphore:
+                    completion = await backend.complete(request.system_prompt, request.content, request.max_tokens)
+            except BackendRateLimitError as e:
+                if attempt == self.max_rate_limit_retries:
+                    raise
+                self.rate_limiter.backoff(e.retry_after)
+                continue
+            self.rate_limiter.success()
+            return completion
+
+    def needs_escalation(self, scores: Optional[Scores]) -> bool:
+        """Whether first-tier scores are too uncertain to keep."""
+        if scores is None:
+            return True
+        positive, negative, _, sarcastic = scores
+        return (
+            abs(positive - 0.5) < self.escalation_margin
+            or abs(negative - 0.5) < self.escalation_margin
+            or sarcastic >= self.sarcasm_threshold
+        )
+
+    def token_stats(self) -> Dict[str, Dict]:
+        """Estimated tokens as sent vs untrimmed, and what the providers report (incl. cached)."""
+        stats = {'requests': self.request_builder.stats(), 'usage': dict(self.backend.usage)}
+        if self.escalation_backend:
+            stats['escalation_usage'] = dict(self.escalation_backend.usage)
+        return stats
+
+    def escalation_stats(self) -> Dict[str, Optional[float]]:
+        return {
+            'first_tier': self.first_tier_count,
+            'escalated': self.escalated_count,
+            'escalation_rate': (
+                self.escalated_count / self.first_tier_count if self.first_tier_count else None
+            ),
+        }
+
+    async def _score_text(self, text: str, backend: Optional[SentimentBackend] = None) -> Optional[Scores]:
+        """Score one text; None if the reply is malformed or the provider rejects the text.
+
+        Other backend errors (rate limits, timeouts, server errors) are raised.
+        """
+        try:
+            completion = await self._complete(self.request_builder.build_single(text), backend)
+        except BackendRequestError as e:
+            logger.error(f"Sentiment request rejected: {str(e)}")
+            return None
+        try:
+            return parse_scores(json.loads(completion))
+        except ValueError as e:
+            logger.error(f"Malformed sentiment reply: {str(e)}")
+            return None
+
+    async def _escalate(self, coroutine, fallback):
+        """Await an escalation-tier request, keeping the first-tier result if that backend fails."""
+        try:
+            return await coroutine
         except Exception as e:
-            logger.error(f"Error analyzing sentiment: {str(e)}")
+            logger.error(f"Escalation backend failed, keeping first-tier scores: {str(e)}")
+            return fallback
+
+    async def analyze_sentiment(self, text: str) -> Optional[Scores]:
+        """Analyze text sentiment using the configured backend(s)."""
+        if not text or len(text.strip()) == 0:
             return None
 
-    async def process_message_batch(self, messages, conn):
-        """Process a batch of messages."""
-        cursor = conn.cursor()
-        
-        for message_id, chat_id, content in messages:
+        local_scores = classify_trivial(text)
+        if local_scores:
+            self.fast_path_count += 1
+            return local_scores
+
+        scores = await self._score_text(text)
+        if self.escalation_backend:
+            self.first_tier_count += 1
+            if self.needs_escalation(scores):
+                self.escalated_count += 1
+                scores = await self._escalate(self._score_text(text, self.escalation_backend), None) or scores
+        return scores
+
+    async def _request_batch_scores(self, texts: List[str],
+                                    backend: Optional[SentimentBackend] = None) -> Dict[int, Scores]:
+        """Score several texts in one request, keyed by their position in the request.
+
+        A malformed reply yields no scores; backend errors are raised.
+        """
+        completion = await self._complete(self.request_builder.build_batch(texts), backend)
+        try:
+            result = json.loads(completion)
+        except ValueError as e:
+            logger.error(f"Malformed sentiment batch reply: {str(e)}")
+            return {}
+        if isinstance(result, dict):
+            # Some replies wrap the array, e.g. {"results": [...]}
+            result = next((value for value in result.values() if isinstance(value, list)), [])
+
+        scored = {}
+        for item in result if isinstance(result, list) else []:
+            if not isinstance(item, dict):
+                continue
             try:
-                scores = await self.analyze_sentiment(content)
+                index = int(item.get('id'))
+            except (TypeError, ValueError):
+                continue
+            scores = parse_scores(item)
+            if 0 <= index < len(texts) and scores:
+                scored[index] = scores
+        return scored
+
+    async def _score_chunk(self, chunk: List[Tuple[Hashable, str]],
+                           backend: Optional[SentimentBackend] = None) -> Dict[Hashable, Scores]:
+        """Score one request-sized chunk, retrying missing or malformed messages individually.
+
+        If the provider rejects the whole batch (e.g. a content filter), each message is
+        sent on its own, so only the offending ones fail.
+        """
+        results: Dict[Hashable, Scores] = {}
+        try:
+            scored = await self._request_batch_scores([text for _, text in chunk], backend)
+        except BackendRequestError as e:
+            logger.error(f"Sentiment batch rejected: {str(e)}")
+            scored = {}
+        for index, scores in scored.items():
+            results[chunk[index][0]] = scores
+
+        missing = [(key, text) for key, text in chunk if key not in results]
+        if missing:
+            logger.info(f"Retrying {len(missing)} of {len(chunk)} messages individually")
+            retried = await asyncio.gather(*(self._score_text(text, backend) for _, text in missing))
+            for (key, _), scores in zip(missing, retried):
                 if scores:
-                    cursor.execute("""
-                        UPDATE telegram_messages 
-                        SET sentiment_positive = %s,
-                            sentiment_negative = %s,
-                            sentiment_helpful = %s,
-                            sentiment_sarcastic = %s,
-                            sentiment_analyzed = TRUE
-                        WHERE message_id = %s AND chat_id = %s
-                    """, (*scores, message_id, chat_id))
-                    conn.commit()
-                    logger.info(f"Analyzed message {message_id}")
-                
-                # Rate limiting
-                await asyncio.sleep(1)
-                
+                    results[key] = scores
+        return results
+
+    async def _score_batched(self, messages: List[Tuple[Hashable, str]],
+                             backend: Optional[SentimentBackend] = None) -> Dict[Hashable, Scores]:
+        chunks = [
+            messages[start:start + self.score_batch_size]
+            for start in range(0, len(messages), self.score_batch_size)
+        ]
+        results: Dict[Hashable, Scores] = {}
+        for scored in await asyncio.gather(*(self._score_chunk(chunk, backend) for chunk in chunks)):
+            results.update(scored)
+        return results
+
+    async def analyze_sentiment_batch(self, messages: List[Tuple[Hashable, str]]) -> Dict[Hashable, Scores]:
+        """Analyze many messages per request, scoring the requests concurrently.
+
+        Messages are (key, text) pairs; the result maps each successfully scored key to its scores.
+        With an escalation backend, uncertain first-tier results are re-scored by it.
+        Errors from the (first-tier) backend are raised rather than treated as unscored messages.
+        """
+        messages = [(key, text) for key, text in messages if text and text.strip()]
+        results = await self._score_batched(messages)
+        if not self.escalation_backend:
+            return results
+
+        escalate = [(key, text) for key, text in messages if self.needs_escalation(results.get(key))]
+        self.first_tier_count += len(messages)
+        self.escalated_count += len(escalate)
+        if escalate:
+            logger.info(f"Escalating {len(escalate)} of {len(messages)} messages")
+            results.update(await self._escalate(self._score_batched(escalate, self.escalation_backend), {}))
+        return results
+
+    async def score_messages(self, messages: List[WorkItem], conn,
+                             score_sources: Optional[Dict[tuple, str]] = None) -> Dict[tuple, Scores]:
+        """Score (key, content) rows.
+
+        Trivial messages are scored locally, then the content cache is consulted,
+        then the local head (if configured) takes the messages it is confident
+        about, and only what remains is sent to the model. If `score_sources` is
+        given, it is filled with where each key's scores came from.
+        """
+        if score_sources is None:
+            score_sources = {}
+        if self.scoring_client:
+            return await self._score_remotely(messages, score_sources)
+
+        results = {}
+        remaining = []
+        for key, content in messages:
+            local_scores = classify_trivial(content)
+            if local_scores:
+                results[key] = local_scores
+                score_sources[key] = SCORE_SOURCE_FAST_PATH
+            else:
+                remaining.append((key, content))
+        self.fast_path_count += len(results)
+        messages = remaining
+
+        hashes = {key: content_hash(content, self.model_version) for key, content in messages}
+        cached = self.cache.lookup_many(conn, hashes.values())
+
+        # Only one copy of each uncached text goes to the model
+        to_score = {}
+        for key, content in messages:
+            if hashes[key] not in cached:
+                to_score.setdefault(hashes[key], content)
+
+        local = {}
+        if self.local_scorer and to_score:
+            try:
+                local = await self.local_scorer.score_many(conn, to_score)
+            except Exception as e:
+                logger.error(f"Local sentiment head failed, using the model: {str(e)}")
+            self.local_head_count += len(local)
+            to_score = {text_hash: content for text_hash, content in to_score.items() if text_hash not in local}
+
+        fresh = await self.analyze_sentiment_batch(list(to_score.items()))
+        self.cache.store_many(conn, fresh)
+
+        origins = {
+            **{text_hash: SCORE_SOURCE_CACHE for text_hash in cached},
+            **{text_hash: self.local_scorer.score_source for text_hash in local},
+            **{text_hash: SCORE_SOURCE_MODEL for text_hash in fresh},
+        }
+        scores_by_hash = {**cached, **local, **fresh}
+        for key, text_hash in hashes.items():
+            if text_hash in scores_by_hash:
+                results[key] = scores_by_hash[text_hash]
+                score_sources[key] = origins[text_hash]
+        return results
+
+    async def _score_remotely(self, messages: List[WorkItem],
+                              score_sources: Dict[tuple, str]) -> Dict[tuple, Scores]:
+        """Score through the scoring service, stamping rows with the service's model version."""
+        scored = await self.scoring_client.score_texts_with_sources([content for _, content in messages])
+        if self.scoring_client.model_version:
+            self.model_version = self.scoring_client.model_version
+        results = {}
+        for (key, _), (scores, score_source) in zip(messages, scored):
+            if scores:
+                results[key] = scores
+                score_sources[key] = score_source
+        return results
+
+    def write_scores(self, conn, source: SentimentSource, scored: Dict[tuple, Scores],
+                     score_sources: Optional[Dict[tuple, str]] = None):
+        """Write a batch of scores in one statement and one commit.
+
+        Falls back to per-row updates only if the bulk statement fails.
+        """
+        if not scored:
+            return
+        score_sources = score_sources or {}
+        rows = [
+            (*key, *scores, self.model_version, score_sources.get(key)) for key, scores in scored.items()
+        ]
+        cursor = conn.cursor()
+        try:
+            execute_values(cursor, f"""
+                UPDATE {source.table} AS t
+                SET sentiment_positive = v.positive,
+                    sentiment_negative = v.negative,
+                    sentiment_helpful = v.helpful,
+                    sentiment_sarcastic = v.sarcastic,
+                    sentiment_model_version = v.model_version,
+                    sentiment_score_source = v.score_source,
+                    sentiment_analyzed = TRUE,
+                    sentiment_claimed_by = NULL,
+                    sentiment_claimed_at = NULL
+                FROM (VALUES %s) AS v(
+                    {source.key_list}, positive, negative, helpful, sarcastic, model_version, score_source
+                )
+                WHERE {source.key_join('t', 'v')}
+            """, rows,
+                template=source.key_template("%s::float, %s::float, %s::float, %s::float, %s, %s::text"),
+                page_size=len(rows))
+            conn.commit()
+            logger.info(f"Analyzed {len(rows)} rows in {source.table}")
+            return
+        except Exception as e:
+            logger.error(f"Bulk sentiment update failed, falling back to per-row updates: {str(e)}")
+            conn.rollback()
+
+        self.write_scores_per_row(conn, source, scored, score_sources)
+
+    def write_scores_per_row(self, conn, source: SentimentSource, scored: Dict[tuple, Scores],
+                             score_sources: Optional[Dict[tuple, str]] = None):
+        """Write scores one row and one commit at a time, isolating bad rows."""
+        score_sources = score_sources or {}
+        key_filter = ' AND '.join(f"{column} = %s" for column in source.key_columns)
+        cursor = conn.cursor()
+        for key, scores in scored.items():
+            try:
+                cursor.execute(f"""
+                    UPDATE {source.table} 
+                    SET sentiment_positive = %s,
+                        sentiment_negative = %s,
+                        sentiment_helpful = %s,
+                        sentiment_sarcastic = %s,
+                        sentiment_model_version = %s,
+                        sentiment_score_source = %s,
+                        sentiment_analyzed = TRUE,
+                        sentiment_claimed_by = NULL,
+                        sentiment_claimed_at = NULL
+                    WHERE {key_filter}
+                """, (*scores, self.model_version, score_sources.get(key), *key))
+                conn.commit()
+                logger.info(f"Analyzed {source.table} row {key}")
             except Exception as e:
-                logger.error(f"Error processing message {message_id}: {str(e)}")
+                logger.error(f"Error processing {source.table} row {key}: {str(e)}")
                 conn.rollback()
 
-    async def process_unanalyzed_messages(self, batch_size: int = 10):
-        """Process messages that haven't been analyzed yet."""
+    def record_failures(self, conn, source: SentimentSource, failed: List[tuple], error: str):
+        """Count a failed attempt for each row and schedule its retry.
+
+        The retry delay doubles with each attempt; rows reaching max_attempts are
+        copied to sentiment_dead_letters and no longer claimed.
+        """
+        if not failed:
+            return
+        cursor = conn.cursor()
+        try:
+            rows = execute_values(cursor, f"""
+                UPDATE {source.table} AS t
+                SET sentiment_attempts = t.sentiment_attempts + 1,
+                    sentiment_next_attempt_at = NOW() + LEAST(
+                        {float(self.retry_max_seconds)},
+                        {float(self.retry_base_seconds)} * POWER(2, t.sentiment_attempts)
+                    ) * INTERVAL '1 second',
+                    sentiment_claimed_by = NULL,
+                    sentiment_claimed_at = NULL
+                FROM (VALUES %s) AS v({source.key_list})
+                WHERE {source.key_join('t', 'v')}
+                RETURNING {', '.join(f't.{column}' for column in source.key_columns)},
+                          t.{source.content_column}, t.sentiment_attempts
+            """, failed, template=source.key_template(), page_size=len(failed), fetch=True)
+
+            key_size = len(source.key_columns)
+            dead = [
+                (source.table, ':'.join(str(part) for part in row[:key_size]), row[key_size], row[-1], error)
+                for row in rows
+                if row[-1] >= self.max_attempts
+            ]
+            if dead:
+                execute_values(cursor, """
+                    INSERT INTO sentiment_dead_letters (
+                        source_table, source_key, content, attempts, last_error
+                    ) VALUES %s
+                    ON CONFLICT (source_table, source_key) DO UPDATE SET
+                        attempts = EXCLUDED.attempts,
+                        last_error = EXCLUDED.last_error,
+                        dead_lettered_at = CURRENT_TIMESTAMP
+                """, dead)
+                logger.warning(
+                    f"Dead-lettered {len(dead)} {source.table} rows after {self.max_attempts} attempts"
+                )
+            conn.commit()
+            logger.info(f"Scheduled retries for {len(failed)} {source.table} rows")
+        except Exception as e:
+            logger.error(f"Error recording sentiment failures: {str(e)}")
+            conn.rollback()
+        finally:
+            cursor.close()
+
+    def release_claims(self, conn, source: SentimentSource, keys: List[tuple]):
+        """Give leased rows back without counting an attempt against them."""
+        if not keys:
+            return
+        cursor = conn.cursor()
+        try:
+            # Only our own leases: one that expired may already belong to another worker
+            execute_values(cursor, f"""
+                UPDATE {source.table} AS t
+                SET sentiment_claimed_by = NULL,
+                    sentiment_claimed_at = NULL
+                FROM (VALUES %s) AS v({source.key_list}, worker_id)
+                WHERE {source.key_join('t', 'v')}
+                AND t.sentiment_claimed_by = v.worker_id
+            """, [(*key, self.worker_id) for key in keys],
+                template=source.key_template("%s"), page_size=len(keys))
+            conn.commit()
+            logger.info(f"Released {len(keys)} {source.table} rows")
+        except Exception as e:
+            logger.error(f"Error releasing sentiment claims: {str(e)}")
+            conn.rollback()
+        finally:
+            cursor.close()
+
+    async def process_message_batch(self, source: SentimentSource, messages: List[WorkItem], conn):
+        """Process a batch of claimed rows from one source.
+
+        Messages missing from a reply, malformed, or rejected by the provider count
+        as failed attempts, so poison messages eventually dead-letter. If the
+        backend or scoring service itself is unavailable (rate limits exhausted,
+        connection errors, timeouts, server errors), the rows are released
+        untouched and the error is raised so the worker backs off.
+        """
+        score_sources = {}
+        try:
+            scored = await self.score_messages(messages, conn, score_sources)
+        except Exception as e:
+            logger.error(f"Error scoring batch: {str(e)}")
+            self.release_claims(conn, source, [key for key, _ in messages])
+            raise
+
+        self.write_scores(conn, source, scored, score_sources)
+        self.record_failures(
+            conn, source, [key for key, _ in messages if key not in scored],
+            "no valid scores returned (malformed reply or request rejected)"
+        )
+
+    def _claim(self, conn, source: SentimentSource, condition: str, limit: int,
+               newest_first: bool = True) -> List[WorkItem]:
+        """Lease up to `limit` unanalyzed rows matching `condition` to this worker.
+
+        SKIP LOCKED keeps concurrent workers from claiming the same rows, and rows
+        whose lease has expired (e.g. a crashed worker) become claimable again.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""
+                UPDATE {source.table} AS t
+                SET sentiment_claimed_by = %s,
+                    sentiment_claimed_at = NOW()
+                FROM (
+                    SELECT {source.key_list}
+                    FROM {source.table}
+                    WHERE sentiment_analyzed = FALSE
+                    AND {source.content_column} IS NOT NULL
+                    AND {source.content_column} != ''
+                    AND (sentiment_claimed_at IS NULL
+                         OR sentiment_claimed_at < NOW() - %s * INTERVAL '1 second')
+                    AND sentiment_attempts < %s
+                    AND (sentiment_next_attempt_at IS NULL OR sentiment_next_attempt_at <= NOW())
+                    AND {condition}
+                    ORDER BY {source.timestamp_column} {'DESC' if newest_first else 'ASC'}
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ) AS claimable
+                WHERE {source.key_join('t', 'claimable')}
+                RETURNING {', '.join(f't.{column}' for column in source.key_columns)},
+                          t.{source.content_column}
+            """, (self.worker_id, self.lease_seconds, self.max_attempts, limit))
+            messages = [(tuple(row[:-1]), row[-1]) for row in cursor.fetchall()]
+            conn.commit()
+            return messages
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def claim_messages(self, conn, source: SentimentSource, batch_size: int) -> List[WorkItem]:
+        """Lease a batch of unanalyzed rows, honouring each priority class's share.
+
+        Each class first claims up to its guaranteed quota; capacity a class doesn't
+        use is then offered to the classes in priority order.
+        """
+        priority_classes = self.priority_classes[source.table]
+        quotas = allocate_quotas(priority_classes, batch_size)
+        messages = []
+        claimed_by_class = {}
+        for priority in priority_classes:
+            limit = min(quotas[priority.name], batch_size - len(messages))
+            if limit <= 0:
+                break
+            rows = self._claim(conn, source, priority.condition, limit, priority.newest_first)
+            claimed_by_class[priority.name] = len(rows)
+            messages.extend(rows)
+
+        for priority in priority_classes:
+            remaining = batch_size - len(messages)
+            if remaining <= 0:
+                break
+            rows = self._claim(conn, source, priority.condition, remaining, priority.newest_first)
+            claimed_by_class[priority.name] = claimed_by_class.get(priority.name, 0) + len(rows)
+            messages.extend(rows)
+
+        if messages:
+            logger.info(f"Claimed {source.table} rows by priority: {claimed_by_class}")
+        return messages
+
+    def seconds_until_next_retry(self, conn) -> Optional[float]:
+        """Seconds until the earliest scheduled retry across sources falls due, if any."""
+        cursor = conn.cursor()
+        try:
+            due = []
+            for source in self.sources:
+                cursor.execute(f"""
+                    SELECT EXTRACT(EPOCH FROM MIN(sentiment_next_attempt_at) - NOW())
+                    FROM {source.table}
+                    WHERE sentiment_analyzed = FALSE
+                    AND sentiment_attempts < %s
+                    AND sentiment_next_attempt_at > NOW()
+                """, (self.max_attempts,))
+                row = cursor.fetchone()
+                if row and row[0] is not None:
+                    due.append(float(row[0]))
+            conn.commit()
+            return min(due) if due else None
+        except Exception as e:
+            logger.error(f"Error checking scheduled retries: {str(e)}")
+            conn.rollback()
+            return None
+        finally:
+            cursor.close()
+
+    def outage_backoff(self) -> float:
+        self.consecutive_outages += 1
+        return min(
+            self.outage_backoff_max_seconds,
+            self.outage_backoff_seconds * 2 ** (self.consecutive_outages - 1)
+        )
+
+    async def process_unanalyzed_messages(self, batch_size: int = 200, listen: bool = False,
+                                          poll_interval: float = 60):
+        """Process rows that haven't been analyzed yet, across all sources.
+
+        With `listen`, an idle analyzer wakes as soon as new rows are inserted
+        (via the NOTIFY trigger) and `poll_interval` only acts as a safety net.
+        Either way an idle wait never outlasts the earliest scheduled retry.
+        """
+        listener = None
         try:
             conn = get_db_connection()
-            cursor = conn.cursor()
+            if listen:
+                listener = NotificationListener()
+                listener.connect()
             
             while True:
                 try:
-                    # Get batch of unanalyzed messages
-                    cursor.execute("""
-                        SELECT message_id, chat_id, content 
-                        FROM telegram_messages 
-                        WHERE sentiment_analyzed = FALSE 
-                        AND content IS NOT NULL 
-                        AND content != ''
-                        ORDER BY timestamp DESC
-                        LIMIT %s
-                    """, (batch_size,))
-                    
-                    messages = cursor.fetchall()
+                    batches = [
+                        (source, self.claim_messages(conn, source, batch_size))
+                        for source in self.sources
+                    ]
+                    batches = [(source, messages) for source, messages in batches if messages]
                     
-                    if not messages:
-                        logger.info("No new messages to analyze. Waiting...")
-                        await asyncio.sleep(60)  # Wait a minute before checking again
+                    if not batches:
+                        timeout = poll_interval
+                        next_retry = self.seconds_until_next_retry(conn)
+                        if next_retry is not None:
+                            timeout = max(1.0, min(timeout, next_retry))
+                        if listener:
+                            if await listener.wait(timeout):
+                                logger.info("New rows inserted, waking up")
+                        else:
+                            logger.info("No new messages to analyze. Waiting...")
+                            await asyncio.sleep(timeout)  # Wait before checking again
                         continue
                     
-                    logger.info(f"Processing batch of {len(messages)} messages")
-                    await self.process_message_batch(messages, conn)
+                    for source, messages in batches:
+                        logger.info(f"Processing batch of {len(messages)} {source.table} rows")
+                    # Sources are scored together so they share the worker pool and rate limiter
+                    outcomes = await asyncio.gather(*(
+                        self.process_message_batch(source, messages, conn)
+                        for source, messages in batches
+                    ), return_exceptions=True)
+                    errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+                    if errors:
+                        delay = self.outage_backoff()
+                        logger.warning(f"Sentiment backend unavailable ({errors[0]}), backing off {delay:.0f}s")
+                        await asyncio.sleep(delay)
+                        continue
+                    self.consecutive_outages = 0
+                    logger.info(
+                        f"Sentiment cache stats: {self.cache.stats()}, "
+                        f"fast path: {self.fast_path_count}, "
+                        f"local head: {self.local_head_count}, "
+                        f"cascade: {self.escalation_stats()}, "
+                        f"tokens: {self.token_stats()}"
+                    )
                     
                 except Exception as e:
                     logger.error(f"Error in processing loop: {str(e)}")
@@ -127,16 +739,14 @@ class SentimentAnalyzer:
         except Exception as e:
             logger.error(f"Database connection error: {str(e)}")
         finally:
-            cursor.close()
+            if listener:
+                listener.close()
             conn.close()
 
-async def main():
-    """Main function to run the sentiment analyzer."""
+def setup_database(conn, sources: Sequence[SentimentSource] = (TELEGRAM_MESSAGES,)):
+    """Create the sentiment columns, tables and triggers if they don't exist."""
+    cursor = conn.cursor()
     try:
-        # Create tables if they don't exist
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Add sentiment columns if they don't exist
         cursor.execute("""
             ALTER TABLE telegram_messages
@@ -145,34 +755,110 @@ async def main():
             ADD COLUMN IF NOT EXISTS sentiment_helpful FLOAT,
             ADD COLUMN IF NOT EXISTS sentiment_sarcastic FLOAT,
             ADD COLUMN IF NOT EXISTS sentiment_analyzed BOOLEAN DEFAULT FALSE;
-            
+        
             CREATE INDEX IF NOT EXISTS idx_sentiment_positive ON telegram_messages(sentiment_positive);
             CREATE INDEX IF NOT EXISTS idx_sentiment_negative ON telegram_messages(sentiment_negative);
             CREATE INDEX IF NOT EXISTS idx_sentiment_helpful ON telegram_messages(sentiment_helpful);
             CREATE INDEX IF NOT EXISTS idx_sentiment_sarcastic ON telegram_messages(sentiment_sarcastic);
             CREATE INDEX IF NOT EXISTS idx_sentiment_analyzed ON telegram_messages(sentiment_analyzed);
         """)
+        for source in sources:
+            cursor.execute(source.setup_sql())
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment_dead_letters (
+                source_table TEXT,
+                source_key TEXT,
+                content TEXT,
+                attempts INTEGER NOT NULL,
+                last_error TEXT,
+                dead_lettered_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (source_table, source_key)
+            );
+        """)
+        cursor.execute(SENTIMENT_CACHE_SCHEMA)
+        cursor.execute(EMBEDDING_SCHEMA)
         conn.commit()
+    finally:
+        cursor.close()
+
+def sources_from_env() -> List[SentimentSource]:
+    return [
+        SOURCES[table.strip()]
+        for table in os.getenv('SENTIMENT_SOURCES', TELEGRAM_MESSAGES.table).split(',')
+        if table.strip()
+    ]
+
+
+def analyzer_from_env(**overrides) -> SentimentAnalyzer:
+    """SentimentAnalyzer configured from the environment.
+
+    The worker, the scoring service and the rescore job all build their analyzer
+    here, so they agree on everything that goes into the model version; callers
+    only override what should differ, such as the request budget.
+    """
+    escalation_backend = None
+    if os.getenv('SENTIMENT_ESCALATION_BACKEND'):
+        escalation_backend = get_backend(
+            os.getenv('SENTIMENT_ESCALATION_BACKEND'), os.getenv('SENTIMENT_ESCALATION_MODEL')
+        )
+    settings = dict(
+        escalation_backend=escalation_backend,
+        local_scorer=load_local_scorer(),
+        max_concurrency=int(os.getenv('SENTIMENT_MAX_CONCURRENCY', '8')),
+        max_content_tokens=int(os.getenv('SENTIMENT_MAX_CONTENT_TOKENS', '256')),
+        example_index=load_example_index(),
+        few_shot_k=int(os.getenv('SENTIMENT_FEW_SHOT_K', '4')),
+        lease_seconds=int(os.getenv('SENTIMENT_LEASE_SECONDS', '300')),
+        max_attempts=int(os.getenv('SENTIMENT_MAX_ATTEMPTS', '5')),
+        sources=sources_from_env(),
+        live_window_seconds=int(os.getenv('SENTIMENT_LIVE_WINDOW_SECONDS', '3600')),
+        bot_sender_ids=[
+            int(sender_id) for sender_id in os.getenv('SENTIMENT_BOT_SENDER_IDS', '').split(',')
+            if sender_id.strip()
+        ],
+        requests_per_minute=int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', '3500')),
+        tokens_per_minute=int(os.getenv('OPENAI_TOKENS_PER_MINUTE', '90000'))
+    )
+    settings.update(overrides)
+    return SentimentAnalyzer(**settings)
+
+
+async def main():
+    """Main function to run the sentiment analyzer."""
+    try:
+        sources = sources_from_env()
+
+        # Create tables if they don't exist
+        conn = get_db_connection()
+        setup_database(conn, sources)
         
         logger.info("Database setup complete")
         
         # Start the analyzer
-        analyzer = SentimentAnalyzer()
-        logger.info("Starting sentiment analysis process...")
+        scoring_client = None
+        if os.getenv('SENTIMENT_SERVICE_URL'):
+            scoring_client = ScoringClient()
+            logger.info(f"Scoring through the sentiment service at {scoring_client.base_url}")
+
+        analyzer = analyzer_from_env(sources=sources, scoring_client=scoring_client)
+        logger.info(f"Starting sentiment analysis process (model version {analyzer.model_version})...")
         
-        await analyzer.process_unanalyzed_messages()
+        await analyzer.process_unanalyzed_messages(
+            listen=os.getenv('SENTIMENT_LISTEN', 'true').lower() == 'true',
+            poll_interval=float(os.getenv('SENTIMENT_POLL_INTERVAL', '300'))
+        )
         
     except Exception as e:
         logger.error(f"Critical error in main: {str(e)}")
     finally:
-        cursor.close()
         conn.close()
 
 if __name__ == "__main__":
     # Required environment variables
-    required_vars = [
-        'OPENAI_API_KEY'
-    ]
+    required_vars = {
+        'openai': ['OPENAI_API_KEY'],
+        'ollama': ['RUNPOD_URL'],
+    }.get(os.getenv('SENTIMENT_BACKEND', 'openai'), [])
     
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     if missing_vars:
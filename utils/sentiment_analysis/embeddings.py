@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+import aiohttp
+import numpy as np
+from openai import AsyncOpenAI
+from psycopg2 import Binary
+from psycopg2.extras import execute_values
+
+from lib.ollama import get_ollama_client
+from sentiment_analysis.cache import content_hash, normalize_content
+
+logger = logging.getLogger(__name__)
+
+# One row per distinct (normalized) text and embedding model, stored as float16 bytes
+EMBEDDING_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sentiment_embeddings (
+        content_hash TEXT,
+        model TEXT,
+        dimensions INTEGER NOT NULL,
+        embedding BYTEA NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (content_hash, model)
+    );
+"""
+
+STORAGE_DTYPE = np.float16
+
+
+class Embedder:
+    """Turns texts into fixed-size vectors."""
+
+    name = 'base'
+
+    def __init__(self, model: str):
+        self.model = model
+
+    async def embed(self, texts: List[str]) -> List[np.ndarray]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class OpenAIEmbedder(Embedder):
+    name = 'openai'
+
+    def __init__(self, model: str = 'text-embedding-3-small', base_url: Optional[str] = None):
+        super().__init__(model)
+        self.client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), base_url=base_url)
+
+    async def embed(self, texts: List[str]) -> List[np.ndarray]:
+        response = await self.client.embeddings.create(model=self.model, input=texts)
+        ordered = sorted(response.data, key=lambda item: item.index)
+        return [np.asarray(item.embedding, dtype=np.float32) for item in ordered]
+
+
+class OllamaEmbedder(Embedder):
+    """Embeddings from Ollama's /api/embed (see lib/ollama.py)."""
+
+    name = 'ollama'
+
+    def __init__(self, model: str = 'nomic-embed-text', base_url: Optional[str] = None):
+        super().__init__(model)
+        self.url = f"{base_url or get_ollama_client()}/api/embed"
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def embed(self, texts: List[str]) -> List[np.ndarray]:
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        async with self.session.post(self.url, json={"model": self.model, "input": texts}) as response:
+            response.raise_for_status()
+            response_json = await response.json()
+        return [np.asarray(vector, dtype=np.float32) for vector in response_json['embeddings']]
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+
+class HashingEmbedder(Embedder):
+    """Offline bag-of-words embedding via feature hashing, for tests and cold starts."""
+
+    name = 'hashing'
+
+    def __init__(self, model: str = 'hashing-512'):
+        super().__init__(model)
+        self.dimensions = int(model.rsplit('-', 1)[-1])
+
+    async def embed(self, texts: List[str]) -> List[np.ndarray]:
+        vectors = []
+        for text in texts:
+            vector = np.zeros(self.dimensions, dtype=np.float32)
+            for word in normalize_content(text).split():
+                digest = int(content_hash(word)[:8], 16)
+                vector[digest % self.dimensions] += 1.0 if digest & (1 << 31) else -1.0
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm else vector)
+        return vectors
+
+
+EMBEDDERS = {
+    OpenAIEmbedder.name: OpenAIEmbedder,
+    OllamaEmbedder.name: OllamaEmbedder,
+    HashingEmbedder.name: HashingEmbedder,
+}
+
+
+def get_embedder(name: Optional[str] = None, model: Optional[str] = None) -> Embedder:
+    """Build an embedder by name, defaulting to SENTIMENT_EMBEDDER / SENTIMENT_EMBEDDING_MODEL."""
+    name = name or os.getenv('SENTIMENT_EMBEDDER', OpenAIEmbedder.name)
+    model = model or os.getenv('SENTIMENT_EMBEDDING_MODEL')
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unknown embedder '{name}', expected one of {', '.join(EMBEDDERS)}")
+    return EMBEDDERS[name](model) if model else EMBEDDERS[name]()
+
+
+class EmbeddingStore:
+    """Computes each distinct text's embedding once and keeps it in sentiment_embeddings."""
+
+    def __init__(self, embedder: Embedder, request_size: int = 256, max_concurrency: int = 4):
+        self.embedder = embedder
+        self.request_size = request_size
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.computed = 0
+
+    @property
+    def model(self) -> str:
+        return f"{self.embedder.name}:{self.embedder.model}"
+
+    def text_hash(self, text: str) -> str:
+        return content_hash(text, self.model)
+
+    def load_many(self, conn, hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        hashes = list(set(hashes))
+        if not hashes:
+            return {}
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT content_hash, embedding
+                FROM sentiment_embeddings
+                WHERE model = %s AND content_hash = ANY(%s)
+            """, (self.model, hashes))
+            found = {
+                key: np.frombuffer(bytes(embedding), dtype=STORAGE_DTYPE).astype(np.float32)
+                for key, embedding in cursor.fetchall()
+            }
+            conn.commit()
+            return found
+        except Exception as e:
+            logger.error(f"Error reading embeddings: {str(e)}")
+            conn.rollback()
+            return {}
+        finally:
+            cursor.close()
+
+    def store_many(self, conn, vectors: Dict[str, np.ndarray]):
+        if not vectors:
+            return
+        cursor = conn.cursor()
+        try:
+            execute_values(cursor, """
+                INSERT INTO sentiment_embeddings (content_hash, model, dimensions, embedding)
+                VALUES %s
+                ON CONFLICT (content_hash, model) DO NOTHING
+            """, [
+                (key, self.model, len(vector), Binary(vector.astype(STORAGE_DTYPE).tobytes()))
+                for key, vector in vectors.items()
+            ])
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error writing embeddings: {str(e)}")
+            conn.rollback()
+        finally:
+            cursor.close()
+
+    async def _embed_chunk(self, chunk: List[tuple]) -> Dict[str, np.ndarray]:
+        async with self.semaphore:
+            vectors = await self.embedder.embed([text for _, text in chunk])
+        return {key: vector for (key, _), vector in zip(chunk, vectors)}
+
+    async def embed_many(self, conn, texts: Dict[str, str]) -> Dict[str, np.ndarray]:
+        """Embeddings for {text hash: text}, computing and storing only the missing ones."""
+        found = self.load_many(conn, texts.keys())
+        missing = [(key, text) for key, text in texts.items() if key not in found]
+        chunks = [
+            missing[start:start + self.request_size]
+            for start in range(0, len(missing), self.request_size)
+        ]
+        fresh: Dict[str, np.ndarray] = {}
+        for computed in await asyncio.gather(*(self._embed_chunk(chunk) for chunk in chunks)):
+            fresh.update(computed)
+        self.computed += len(fresh)
+        self.store_many(conn, fresh)
+        return {**found, **fresh}
@@ -0,0 +1,227 @@
+"""Offline evaluation of sentiment backends.
+
+Replays every saved SentimentExample (hand-labelled) plus a random sample of
+already-scored telegram_messages (labelled by the production model) through
+each backend, and reports accuracy against the labels, the delta against the
+first backend, throughput, request latency percentiles and token usage.
+
+    python -m sentiment_analysis.evaluate --backend openai:gpt-3.5-turbo \\
+        --backend openai:gpt-4o-mini --backend ollama:llama3.1:8b --sample 500 --concurrency 16
+
+Backends are given as name[:model]; the database is only read.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from db.db_postgres import get_db_connection
+from sentiment_analysis.backends import get_backend
+from sentiment_analysis.benchmark import TimedBackend, percentile
+from sentiment_analysis.core import SentimentAnalyzer
+from sentiment_analysis.few_shot import load_examples, load_example_index
+from sentiment_analysis.sources import MODEL_SCORE_SOURCES, SENTIMENT_KEYS, Scores
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# (text, label scores)
+LabelledText = Tuple[str, Scores]
+
+
+def load_example_set(path: str) -> List[LabelledText]:
+    return [
+        (example.content, (example.positive, example.negative, example.helpful, example.sarcastic))
+        for example in load_examples(path)
+    ]
+
+
+def sample_telegram_messages(conn, sample_size: int) -> List[LabelledText]:
+    """Random messages the model scored, labelled with their stored scores.
+
+    Rows scored by the fast-path rules or a local head are skipped: grading a
+    backend against those would measure agreement with the rules, not the model.
+    """
+    if sample_size <= 0:
+        return []
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT content, sentiment_positive, sentiment_negative,
+                   sentiment_helpful, sentiment_sarcastic
+            FROM telegram_messages
+            WHERE sentiment_analyzed = TRUE
+            AND sentiment_score_source = ANY(%s)
+            AND sentiment_positive IS NOT NULL
+            AND sentiment_negative IS NOT NULL
+            AND sentiment_helpful IS NOT NULL
+            AND sentiment_sarcastic IS NOT NULL
+            AND length(content) > 10
+            ORDER BY random()
+            LIMIT %s
+        """, (list(MODEL_SCORE_SOURCES), sample_size))
+        return [(row[0], tuple(row[1:])) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def accuracy_report(labelled: List[LabelledText], scored: Dict[int, Scores]) -> Dict:
+    """Mean absolute error and agreement on which side of 0.5 each score falls, per dimension."""
+    pairs = [(labelled[index][1], scores) for index, scores in scored.items()]
+    report = {'messages': len(labelled), 'scored': len(pairs)}
+    if not pairs:
+        return report
+
+    for dimension, key in enumerate(SENTIMENT_KEYS):
+        errors = [abs(predicted[dimension] - label[dimension]) for label, predicted in pairs]
+        agreement = [(predicted[dimension] >= 0.5) == (label[dimension] >= 0.5) for label, predicted in pairs]
+        report[key] = {
+            'mae': round(sum(errors) / len(errors), 4),
+            'agreement': round(sum(agreement) / len(agreement), 4),
+        }
+    report['mae'] = round(sum(report[key]['mae'] for key in SENTIMENT_KEYS) / len(SENTIMENT_KEYS), 4)
+    report['agreement'] = round(
+        sum(report[key]['agreement'] for key in SENTIMENT_KEYS) / len(SENTIMENT_KEYS), 4
+    )
+    return report
+
+
+async def evaluate_backend(spec: str, datasets: Dict[str, List[LabelledText]], args) -> Dict:
+    name, _, model = spec.partition(':')
+    backend = TimedBackend(get_backend(name, model or None))
+    analyzer = SentimentAnalyzer(
+        backend=backend,
+        score_batch_size=args.score_batch_size,
+        max_concurrency=args.concurrency,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        max_content_tokens=args.max_content_tokens,
+        # The evaluated examples may be in the few-shot file too; they must not retrieve themselves
+        example_index=(
+            load_example_index(args.few_shot_examples, exclude_exact_matches=True)
+            if args.few_shot_examples else None
+        ),
+        few_shot_k=args.few_shot_k
+    )
+
+    results = {}
+    started = time.perf_counter()
+    try:
+        for dataset, labelled in datasets.items():
+            step = time.perf_counter()
+            # Model only: the cache, fast path and local head would hide backend differences
+            scored = await analyzer.analyze_sentiment_batch(
+                [(index, text) for index, (text, _) in enumerate(labelled)]
+            )
+            results[dataset] = accuracy_report(labelled, scored)
+            results[dataset]['elapsed_s'] = round(time.perf_counter() - step, 3)
+    finally:
+        await backend.backend.close()
+    elapsed = time.perf_counter() - started
+    total = sum(len(labelled) for labelled in datasets.values())
+
+    return {
+        'backend': spec,
+        'model_version': analyzer.model_version,
+        'datasets': results,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_sec': round(total / elapsed, 2) if elapsed else None,
+        'requests': len(backend.latencies),
+        'request_latency_ms': {
+            'p50': round(percentile(backend.latencies, 50) * 1000, 1),
+            'p95': round(percentile(backend.latencies, 95) * 1000, 1),
+            'p99': round(percentile(backend.latencies, 99) * 1000, 1),
+        },
+        'tokens': {
+            'requests': analyzer.request_builder.stats(),
+            'usage': backend.backend.usage,
+        },
+    }
+
+
+def add_deltas(reports: List[Dict]):
+    """Accuracy of each backend relative to the first one."""
+    baseline = reports[0]['datasets']
+    for report in reports:
+        for dataset, result in report['datasets'].items():
+            reference: Optional[Dict] = baseline.get(dataset)
+            if reference and 'mae' in result and 'mae' in reference:
+                result['delta'] = {
+                    'mae': round(result['mae'] - reference['mae'], 4),
+                    'agreement': round(result['agreement'] - reference['agreement'], 4),
+                }
+
+
+def print_summary(reports: List[Dict]):
+    for report in reports:
+        accuracy = ', '.join(
+            f"{dataset}: agreement {result.get('agreement')} "
+            f"({result.get('delta', {}).get('agreement', 0):+.4f}), mae {result.get('mae')}"
+            for dataset, result in report['datasets'].items()
+        )
+        print(
+            f"{report['backend']:<32} {report['messages_per_sec']} msg/s, "
+            f"p50 {report['request_latency_ms']['p50']}ms, p95 {report['request_latency_ms']['p95']}ms, "
+            f"{report['tokens']['usage']['prompt_tokens']} prompt tokens | {accuracy}"
+        )
+
+
+async def run_evaluation(args) -> Dict:
+    datasets = {}
+    examples = load_example_set(args.examples)
+    if examples:
+        datasets['examples'] = examples
+    if args.sample:
+        conn = get_db_connection()
+        try:
+            datasets['telegram_sample'] = sample_telegram_messages(conn, args.sample)
+        finally:
+            conn.close()
+    if not datasets:
+        raise ValueError("Nothing to evaluate: no saved examples and no telegram sample requested")
+    logger.info(', '.join(f"{len(labelled)} {dataset}" for dataset, labelled in datasets.items()))
+
+    reports = []
+    for spec in args.backend or ['openai']:
+        logger.info(f"Evaluating {spec}")
+        reports.append(await evaluate_backend(spec, datasets, args))
+    add_deltas(reports)
+
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": vars(args),
+        "reports": reports,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate sentiment backends against labelled messages")
+    parser.add_argument('--backend', action='append', help="name[:model], repeatable; the first is the baseline")
+    parser.add_argument('--examples', default='sentiment_examples.json')
+    parser.add_argument('--sample', type=int, default=200, help="scored telegram_messages to replay")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--score-batch-size', type=int, default=20)
+    parser.add_argument('--requests-per-minute', type=int, default=3500)
+    parser.add_argument('--tokens-per-minute', type=int, default=90000)
+    parser.add_argument('--max-content-tokens', type=int, default=256)
+    parser.add_argument('--few-shot-examples', help="examples file for few-shot retrieval in prompts")
+    parser.add_argument('--few-shot-k', type=int, default=4)
+    parser.add_argument('--output', help="also write the JSON report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.getLogger('sentiment_analysis.core').setLevel(logging.WARNING)
+
+    report = asyncio.run(run_evaluation(args))
+    print_summary(report['reports'])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
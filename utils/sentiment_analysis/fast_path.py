@@ -0,0 +1,90 @@
+import re
+import unicodedata
+from typing import Optional
+
+from lib.ignore_list import IGNORED_COMMANDS, IGNORED_PHRASES
+from sentiment_analysis.sources import Scores
+
+# (positive, negative, helpful, sarcastic)
+NEUTRAL_SCORES = (0.1, 0.1, 0.0, 0.0)
+COMMAND_SCORES = (0.0, 0.0, 0.0, 0.0)
+SPAM_SCORES = (0.0, 0.5, 0.0, 0.0)
+LINK_SCORES = (0.1, 0.0, 0.4, 0.0)
+
+POSITIVE_WORDS = {
+    'gm', 'gn', 'wagmi', 'lfg', 'bullish', 'nice', 'thanks', 'thx', 'ty',
+    'lol', 'lmao', 'based', 'love', 'great', 'awesome', 'amazing', 'congrats',
+    'moon', 'pump', 'quack', 'yes', 'yay', 'cool', 'wow', 'legend', 'gg',
+}
+NEGATIVE_WORDS = {
+    'ngmi', 'rug', 'rugged', 'scam', 'dump', 'dumping', 'bearish', 'fud', 'rekt',
+    'dead', 'sad', 'trash', 'ugh', 'bad', 'wtf', 'fake',
+}
+
+POSITIVE_EMOJI = set('🚀🔥❤😂🤣👍💎🙌🎉😍🥳💯✅🦆😎🤑💰📈🙏👏😁😊🥰💪🤝⭐🌕🐂')
+NEGATIVE_EMOJI = set('😡💩👎😢😭🤮📉💀☠🤡😤😠🐻😞😔🙄🚩⚠')
+
+URL = re.compile(r'^(https?://|www\.|t\.me/)\S+$', re.IGNORECASE)
+WORD = re.compile(r"^[\w'!?.]+$")
+# Long messages containing an ignore-list phrase are usually real discussion
+SPAM_MAX_WORDS = 8
+SPAM_COMMANDS = {command.lower() for command in IGNORED_COMMANDS}
+# Only the multi-word promo phrases ("claim your", "free tokens", ...); single ignore-list
+# words such as "report", "bot" or "fake" turn up in ordinary chat and are left to the model
+SPAM_PHRASES = re.compile(
+    r'\b(' + '|'.join(re.escape(phrase) for phrase in sorted(IGNORED_PHRASES) if ' ' in phrase) + r')\b'
+)
+
+
+def _is_emoji(char: str) -> bool:
+    return char in '\ufe0e\ufe0f\u200d' or (
+        ord(char) >= 0x2190 and unicodedata.category(char) in ('So', 'Sk')
+    )
+
+
+def _emoji_scores(emojis: str) -> Scores:
+    positive = sum(1 for char in emojis if char in POSITIVE_EMOJI)
+    negative = sum(1 for char in emojis if char in NEGATIVE_EMOJI)
+    total = positive + negative
+    if total == 0:
+        return NEUTRAL_SCORES
+    return (round(0.9 * positive / total, 2), round(0.9 * negative / total, 2), 0.0, 0.0)
+
+
+def classify_trivial(text: str) -> Optional[Scores]:
+    """Score trivially classifiable messages locally.
+
+    Handles bot commands, promo spam, bare links, emoji-only messages and
+    single words from the lexicons. Returns None when the message needs the LLM.
+    """
+    stripped = text.strip()
+    if not stripped:
+        return None
+    lowered = stripped.lower()
+    words = lowered.split()
+
+    if stripped.startswith('/'):
+        command = words[0].split('@')[0]
+        if command in SPAM_COMMANDS:
+            return SPAM_SCORES
+        if len(words) == 1:
+            return COMMAND_SCORES
+
+    if len(words) <= SPAM_MAX_WORDS and SPAM_PHRASES.search(lowered):
+        return SPAM_SCORES
+
+    if len(words) == 1 and URL.match(stripped):
+        return LINK_SCORES
+
+    if all(_is_emoji(char) or char.isspace() for char in stripped):
+        return _emoji_scores(stripped)
+
+    if len(words) == 1 and WORD.match(lowered):
+        word = lowered.strip("!?.'")
+        if word in POSITIVE_WORDS:
+            return (0.8, 0.0, 0.0, 0.0)
+        if word in NEGATIVE_WORDS:
+            return (0.0, 0.8, 0.0, 0.0)
+
+    # Anything else, including single words outside the lexicons, is left to the model
+    return None
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from sentiment_analysis.cache import normalize_content
+
+logger = logging.getLogger(__name__)
+
+# Words, plus the symbols that carry tone: ! ? and non-ASCII ones such as emoji
+TOKEN = re.compile(r'\w+|[!?]|[^\w\s\x00-\x7f]')
+
+
+@dataclass
+class SentimentExample:
+    content: str
+    positive: float
+    negative: float
+    helpful: float
+    sarcastic: float
+    category: str
+    message_id: Optional[int] = None
+    notes: Optional[str] = None
+
+
+def load_examples(path: str) -> List[SentimentExample]:
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [SentimentExample(**example) for example in json.load(f)]
+
+
+def tokenize(text: str) -> List[str]:
+    """Unigrams and bigrams over TOKEN matches."""
+    words = TOKEN.findall(normalize_content(text))
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class ExampleIndex:
+    """TF-IDF similarity index over labelled examples."""
+
+    def __init__(self, examples: Sequence[SentimentExample], exclude_exact_matches: bool = False):
+        self.examples = list(examples)
+        # Never retrieve an example for a batch containing its own text (evaluation would leak its labels)
+        self.exclude_exact_matches = exclude_exact_matches
+        self.normalized = [normalize_content(example.content) for example in self.examples]
+        documents = [Counter(tokenize(example.content)) for example in self.examples]
+
+        document_frequency = Counter(term for document in documents for term in document)
+        self.vocabulary = {term: index for index, term in enumerate(sorted(document_frequency))}
+        count = len(self.examples)
+        self.idf = np.array([
+            math.log((1 + count) / (1 + document_frequency[term])) + 1 for term in sorted(document_frequency)
+        ], dtype=np.float32)
+        self.matrix = np.stack([self._vector(document) for document in documents]) if documents else None
+
+        digest = hashlib.sha256(
+            json.dumps([[e.content, e.positive, e.negative, e.helpful, e.sarcastic] for e in self.examples])
+            .encode('utf-8')
+        )
+        # Changes whenever the example set does, so it can be part of the model version
+        self.fingerprint = digest.hexdigest()[:8]
+
+    @classmethod
+    def from_file(cls, path: str, exclude_exact_matches: bool = False) -> 'ExampleIndex':
+        return cls(load_examples(path), exclude_exact_matches)
+
+    def _vector(self, counts: Counter) -> np.ndarray:
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term, frequency in counts.items():
+            index = self.vocabulary.get(term)
+            if index is not None:
+                vector[index] = 1 + math.log(frequency)
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def most_relevant(self, texts: Sequence[str], k: int) -> List[SentimentExample]:
+        """The k examples most similar to any of the texts, best first."""
+        if self.matrix is None or not texts or k <= 0:
+            return []
+        queries = np.stack([self._vector(Counter(tokenize(text))) for text in texts])
+        similarity = (queries @ self.matrix.T).max(axis=0)
+        if self.exclude_exact_matches:
+            query_texts = {normalize_content(text) for text in texts}
+            for index, content in enumerate(self.normalized):
+                if content in query_texts:
+                    similarity[index] = 0
+        ranked = np.argsort(-similarity)[:k]
+        return [self.examples[index] for index in ranked if similarity[index] > 0]
+
+
+def format_examples(examples: Sequence[SentimentExample]) -> str:
+    lines = ["Examples of scored messages:"]
+    for example in examples:
+        lines.append(f"Message: {example.content}")
+        lines.append(
+            f"Scores: positive={example.positive}, negative={example.negative}, "
+            f"helpful={example.helpful}, sarcastic={example.sarcastic}"
+        )
+        if example.notes:
+            lines.append(f"Note: {example.notes}")
+    return '\n'.join(lines)
+
+
+def load_example_index(path: Optional[str] = None,
+                       exclude_exact_matches: bool = False) -> Optional[ExampleIndex]:
+    """ExampleIndex over SENTIMENT_EXAMPLES_FILE, or None when no examples are configured."""
+    path = path or os.getenv('SENTIMENT_EXAMPLES_FILE')
+    if not path:
+        return None
+    index = ExampleIndex.from_file(path, exclude_exact_matches)
+    if not index.examples:
+        logger.warning(f"No sentiment examples found in {path}, prompts will not include examples")
+        return None
+    logger.info(f"Loaded {len(index.examples)} sentiment examples from {path}")
+    return index
@@ -0,0 +1,243 @@
+"""Local sentiment head: ridge regression on stored embeddings.
+
+Fits one linear head per sentiment dimension against the LLM-produced
+sentiment_* labels, so confidently-predicted messages can be scored without a
+model request.
+
+    python -m sentiment_analysis.local_head --output sentiment_head.npz --limit 300000
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from db.db_postgres import get_db_connection
+from sentiment_analysis.embeddings import EMBEDDING_SCHEMA, EmbeddingStore, get_embedder
+from sentiment_analysis.sources import (MODEL_SCORE_SOURCES, SOURCES, TELEGRAM_MESSAGES, Scores,
+                                        SentimentSource)
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+
+@dataclass
+class RidgeHead:
+    """Linear head mapping an embedding to the four sentiment scores."""
+    # (dimensions + 1, 4): last row is the bias
+    weights: np.ndarray
+    # Held-out root mean squared error per sentiment dimension
+    validation_rmse: np.ndarray
+    embedding_model: str
+    trained_on: int
+
+    @classmethod
+    def fit(cls, features: np.ndarray, labels: np.ndarray, embedding_model: str,
+            l2: float = 1.0, validation_fraction: float = 0.1, seed: int = 0) -> 'RidgeHead':
+        """Closed-form ridge regression, all four dimensions solved together."""
+        order = np.random.default_rng(seed).permutation(len(features))
+        validation_size = max(1, int(len(features) * validation_fraction))
+        if len(features) <= validation_size:
+            raise ValueError(
+                f"Need more than {validation_size} labelled rows to hold out a validation split, "
+                f"got {len(features)}"
+            )
+        validation, train = order[:validation_size], order[validation_size:]
+
+        design = np.hstack([features[train], np.ones((len(train), 1), dtype=features.dtype)])
+        penalty = l2 * np.eye(design.shape[1], dtype=np.float64)
+        penalty[-1, -1] = 0.0  # don't shrink the bias
+        weights = np.linalg.solve(
+            design.T.astype(np.float64) @ design + penalty,
+            design.T.astype(np.float64) @ labels[train]
+        ).astype(np.float32)
+
+        head = cls(weights, np.zeros(labels.shape[1], dtype=np.float32), embedding_model, len(train))
+        errors = head.predict(features[validation]) - labels[validation]
+        head.validation_rmse = np.sqrt(np.mean(errors ** 2, axis=0)).astype(np.float32)
+        return head
+
+    @property
+    def fingerprint(self) -> str:
+        """Changes whenever the head is retrained."""
+        return hashlib.sha256(self.weights.tobytes()).hexdigest()[:8]
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        return np.clip(features @ self.weights[:-1] + self.weights[-1], 0.0, 1.0)
+
+    def confident(self, predictions: np.ndarray, margin: float = 0.15, z: float = 2.0) -> np.ndarray:
+        """Rows where every dimension is clear of the 0.5 boundary by the margin and z validation errors."""
+        required = np.maximum(margin, z * self.validation_rmse)
+        return np.all(np.abs(predictions - 0.5) >= required, axis=1)
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            weights=self.weights,
+            validation_rmse=self.validation_rmse,
+            embedding_model=np.array(self.embedding_model),
+            trained_on=np.array(self.trained_on)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'RidgeHead':
+        with np.load(path) as data:
+            return cls(
+                weights=data['weights'],
+                validation_rmse=data['validation_rmse'],
+                embedding_model=str(data['embedding_model']),
+                trained_on=int(data['trained_on'])
+            )
+
+
+class LocalScorer:
+    """Scores texts with a RidgeHead, returning only the confident predictions."""
+
+    def __init__(self, head: RidgeHead, store: EmbeddingStore, margin: float = 0.15, z: float = 2.0):
+        if head.embedding_model != store.model:
+            raise ValueError(
+                f"Head was trained on {head.embedding_model} embeddings, store uses {store.model}"
+            )
+        self.head = head
+        self.store = store
+        self.margin = margin
+        self.z = z
+
+    @property
+    def score_source(self) -> str:
+        """sentiment_score_source for rows this head scored; retraining changes it, marking them for re-scoring."""
+        return f"local_head:{self.head.fingerprint}"
+
+    async def score_many(self, conn, texts: dict) -> dict:
+        """Scores for {key: text}, for the keys the head is confident about."""
+        if not texts:
+            return {}
+        hashes = {key: self.store.text_hash(text) for key, text in texts.items()}
+        vectors = await self.store.embed_many(conn, {hashes[key]: text for key, text in texts.items()})
+        keys = [key for key in texts if hashes[key] in vectors]
+        if not keys:
+            return {}
+
+        predictions = self.head.predict(np.stack([vectors[hashes[key]] for key in keys]))
+        confident = self.head.confident(predictions, self.margin, self.z)
+        return {
+            key: tuple(round(float(score), 4) for score in row)
+            for key, row, keep in zip(keys, predictions, confident)
+            if keep
+        }
+
+
+def load_local_scorer(path: Optional[str] = None) -> Optional[LocalScorer]:
+    """LocalScorer from SENTIMENT_LOCAL_HEAD, or None when no trained head is configured."""
+    path = path or os.getenv('SENTIMENT_LOCAL_HEAD')
+    if not path:
+        return None
+    if not os.path.exists(path):
+        logger.warning(f"Local sentiment head {path} not found, scoring everything with the model")
+        return None
+    head = RidgeHead.load(path)
+    name, _, model = head.embedding_model.partition(':')
+    logger.info(
+        f"Loaded local sentiment head trained on {head.trained_on} rows, "
+        f"validation RMSE {head.validation_rmse.round(3).tolist()}"
+    )
+    return LocalScorer(
+        head,
+        EmbeddingStore(get_embedder(name, model)),
+        margin=float(os.getenv('SENTIMENT_LOCAL_HEAD_MARGIN', '0.15')),
+        z=float(os.getenv('SENTIMENT_LOCAL_HEAD_Z', '2.0'))
+    )
+
+
+def fetch_labelled(conn, source: SentimentSource, limit: int,
+                   model_version: Optional[str] = None) -> List[Tuple[str, Scores]]:
+    """Most recent model-scored rows of a source, optionally restricted to one model version.
+
+    Rows scored by the fast path or by a local head are left out, so the head
+    never learns from canned rule scores or its own predictions.
+    """
+    version_filter = "AND sentiment_model_version = %s" if model_version else ""
+    params = [list(MODEL_SCORE_SOURCES)] + ([model_version] if model_version else [])
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT {source.content_column}, sentiment_positive, sentiment_negative,
+                   sentiment_helpful, sentiment_sarcastic
+            FROM {source.table}
+            WHERE sentiment_analyzed = TRUE
+            AND sentiment_positive IS NOT NULL
+            AND sentiment_score_source = ANY(%s)
+            AND {source.content_column} IS NOT NULL
+            AND {source.content_column} != ''
+            {version_filter}
+            ORDER BY {source.timestamp_column} DESC
+            LIMIT %s
+        """, params + [limit])
+        return [(row[0], tuple(row[1:])) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+async def train(sources: Sequence[SentimentSource], output: str, limit: int, l2: float,
+                model_version: Optional[str] = None) -> RidgeHead:
+    store = EmbeddingStore(get_embedder())
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(EMBEDDING_SCHEMA)
+        conn.commit()
+        cursor.close()
+
+        labelled = {}
+        for source in sources:
+            for text, scores in fetch_labelled(conn, source, limit, model_version):
+                labelled.setdefault(store.text_hash(text), (text, scores))
+        logger.info(f"Embedding {len(labelled)} distinct labelled texts")
+
+        vectors = {}
+        hashes = list(labelled)
+        for start in range(0, len(hashes), 5000):
+            chunk = hashes[start:start + 5000]
+            vectors.update(await store.embed_many(conn, {key: labelled[key][0] for key in chunk}))
+    finally:
+        conn.close()
+        await store.embedder.close()
+
+    keys = [key for key in labelled if key in vectors]
+    if not keys:
+        filters = f" with model version {model_version}" if model_version else ""
+        raise ValueError(f"No model-scored rows{filters} to train the local head on")
+    features = np.stack([vectors[key] for key in keys]).astype(np.float32)
+    labels = np.asarray([labelled[key][1] for key in keys], dtype=np.float32)
+    head = RidgeHead.fit(features, labels, store.model, l2=l2)
+    head.save(output)
+    logger.info(
+        f"Trained local head on {head.trained_on} rows, "
+        f"validation RMSE {head.validation_rmse.round(3).tolist()}, saved to {output}"
+    )
+    return head
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the local sentiment head")
+    parser.add_argument('--output', default='sentiment_head.npz')
+    parser.add_argument('--limit', type=int, default=300000, help="labelled rows per source")
+    parser.add_argument('--l2', type=float, default=1.0)
+    parser.add_argument('--model-version', help="only learn from rows scored by this model version")
+    parser.add_argument('--sources', default=TELEGRAM_MESSAGES.table)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    asyncio.run(train(
+        [SOURCES[table.strip()] for table in args.sources.split(',') if table.strip()],
+        args.output, args.limit, args.l2, args.model_version
+    ))
@@ -2,13 +2,17 @@ import asyncio
 import json
 import logging
 import os
+from collections import deque
 from datetime import datetime
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import psycopg2
 from dotenv import load_dotenv
-from telethon import TelegramClient
+from psycopg2.extras import execute_values
+from telethon import TelegramClient, events
+from telethon.errors import FloodWaitError, TakeoutInitDelayError
 from telethon.sessions import StringSession
 
 # Set up logging
@@ -27,6 +31,94 @@ load_dotenv()
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Per-channel high-water marks: newest message stored, and how far back the backfill has reached
+SYNC_STATE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS telegram_sync_state (
+        chat_id BIGINT PRIMARY KEY,
+        max_message_id BIGINT,
+        oldest_message_id BIGINT,
+        backfill_complete BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+# Message-id ranges of a parallel backfill; each is walked newest to oldest from next_id down to range_start
+BACKFILL_RANGES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS telegram_backfill_ranges (
+        chat_id BIGINT,
+        range_start BIGINT,
+        range_end BIGINT NOT NULL,
+        next_id BIGINT NOT NULL,
+        complete BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (chat_id, range_start)
+    );
+"""
+
+MESSAGE_INSERT = """
+    INSERT INTO telegram_messages (
+        message_id, chat_id, sender_id, sender_username, content,
+        reply_to_message_id, forward_from_id, forward_from_name,
+        media_type, media_file_id, timestamp, edited_timestamp, is_pinned
+    ) VALUES %s
+"""
+
+# Queued after a range's last message, so the writer marks it complete once everything before it is stored.
+# Without a range it marks the channel's whole backfill complete.
+RANGE_DONE = object()
+
+
+@dataclass
+class BackfillRange:
+    start: int
+    end: int
+    next_id: int
+    complete: bool = False
+
+
+async def write_batches(queue: asyncio.Queue, batch_size: int, save: Callable[[list], int]) -> int:
+    """Drain queued items into save() in batches until a None sentinel."""
+    written = 0
+    done = False
+    while not done:
+        item = await queue.get()
+        batch = [item]
+        # Take whatever else is already waiting, up to a batch
+        while len(batch) < batch_size and not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch[-1] is None:
+            done = True
+            batch.pop()
+        if not batch:
+            continue
+
+        # Database I/O runs in a thread so the next page keeps streaming from Telegram meanwhile
+        saved = await asyncio.to_thread(save, batch)
+        written += saved
+        logger.info(f"Saved {saved} messages (total {written})")
+    return written
+
+
+async def run_pipeline(producers: List[Callable[[asyncio.Queue], Awaitable]],
+                       write: Callable[[asyncio.Queue], Awaitable[int]], queue_size: int) -> int:
+    """Run reader coroutines against one bounded queue drained by a single writer."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    writer = asyncio.create_task(write(queue))
+    reading = asyncio.ensure_future(asyncio.gather(*(produce(queue) for produce in producers)))
+    await asyncio.wait({writer, reading}, return_when=asyncio.FIRST_COMPLETED)
+    if writer.done():
+        # The writer only stops before the sentinel when it failed
+        reading.cancel()
+        return writer.result()
+    try:
+        reading.result()
+    except BaseException:
+        writer.cancel()
+        raise
+    await queue.put(None)
+    return await writer
+
+
 def get_db_connection():
     try:
         result = urlparse(DATABASE_URL)
@@ -44,10 +136,10 @@ def get_db_connection():
 
 
 class TelegramMessageFetcher:
-    def __init__(self):
+    def __init__(self, channel_id: Optional[int] = None):
         
         # Initialize configurations
-        self.channel_id = int(os.getenv('TARGET_CHANNEL_ID'))
+        self.channel_id = channel_id or int(os.getenv('TARGET_CHANNEL_ID'))
         self.api_id = int(os.getenv('TELEGRAM_API_ID'))
         self.api_hash = os.getenv('TELEGRAM_API_HASH')
         self.phone = os.getenv('TELEGRAM_PHONE')  # Your phone number including country code (e.g., +12345678900)
@@ -56,92 +148,331 @@ class TelegramMessageFetcher:
         self.client = None
         self.conn = None
         self.cursor = None
+        self.max_message_id = None
+        self.oldest_message_id = None
+        self.backfill_complete = False
 
-    async def save_message(self, message):
-        """Save a message to the database"""
-        try:
-            if message.sender.id in IGNORE_SENDER_IDS:
-                return
-            # Handle media type
-            media_type = None
-            media_file_id = None
-            if message.media:
-                if hasattr(message.media, 'photo'):
-                    media_type = 'photo'
-                    media_file_id = str(message.media.photo.id)
-                elif hasattr(message.media, 'document'):
-                    media_type = 'document'
-                    media_file_id = str(message.media.document.id)
-
-            # For channels, sender might be None
-            if message.sender:
-                sender_id = message.sender.id
-                sender_username = message.sender.username
-            else:
-                sender_id = None
-                sender_username = None
+        # Rows per INSERT/commit, and how many fetched messages may wait for the writer
+        self.batch_size = int(os.getenv('FETCH_BATCH_SIZE', '500'))
+        self.queue_size = int(os.getenv('FETCH_QUEUE_SIZE', '2000'))
+        # Backfill through a takeout session, which Telegram rate-limits far more loosely
+        self.use_takeout = os.getenv('FETCH_TAKEOUT', 'false').lower() == 'true'
+        # Seconds between history requests inside the takeout session
+        self.takeout_wait_time = float(os.getenv('FETCH_TAKEOUT_WAIT_TIME', '0'))
+        # Session files to backfill with; more than one splits history into id ranges fetched in parallel
+        self.sessions = [
+            session.strip() for session in os.getenv('FETCH_SESSIONS', 'anon').split(',') if session.strip()
+        ]
+        self.ranges_per_session = int(os.getenv('FETCH_RANGES_PER_SESSION', '4'))
+        self.extra_clients: List[TelegramClient] = []
+
+    def load_sync_state(self):
+        self.cursor.execute(SYNC_STATE_SCHEMA)
+        self.cursor.execute("""
+            SELECT max_message_id, oldest_message_id, backfill_complete
+            FROM telegram_sync_state
+            WHERE chat_id = %s
+        """, (self.channel_id,))
+        row = self.cursor.fetchone()
+        self.conn.commit()
+        if row:
+            self.max_message_id, self.oldest_message_id, self.backfill_complete = row
+        logger.info(
+            f"Sync state for {self.channel_id}: newest {self.max_message_id}, "
+            f"oldest {self.oldest_message_id}, backfill complete {self.backfill_complete}"
+        )
 
+    def save_sync_state(self, commit: bool = True):
+        try:
             self.cursor.execute("""
-                INSERT INTO telegram_messages (
-                    message_id, chat_id, sender_id, sender_username, content,
-                    reply_to_message_id, forward_from_id, forward_from_name,
-                    media_type, media_file_id, timestamp, edited_timestamp,
-                    is_pinned, sentiment_positive, sentiment_negative, sentiment_helpful, sentiment_sarcastic
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (message_id) DO NOTHING
-            """, (
-                message.id,
-                self.channel_id,
-                sender_id,
-                sender_username,
-                message.message,
-                message.reply_to.reply_to_msg_id if message.reply_to else None,
-                message.forward.from_id.user_id if message.forward and hasattr(message.forward.from_id, 'user_id') else None,
-                message.forward.from_name if message.forward else None,
-                media_type,
-                media_file_id,
-                message.date,
-                message.edit_date,
-                message.pinned,
-                None,
-                None,
-                None,
-                None
-            ))
-            self.conn.commit()
-            logger.info(f"Saved message {message.id}")
+                INSERT INTO telegram_sync_state (
+                    chat_id, max_message_id, oldest_message_id, backfill_complete
+                ) VALUES (%s, %s, %s, %s)
+                ON CONFLICT (chat_id) DO UPDATE SET
+                    max_message_id = EXCLUDED.max_message_id,
+                    oldest_message_id = EXCLUDED.oldest_message_id,
+                    backfill_complete = EXCLUDED.backfill_complete,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (self.channel_id, self.max_message_id, self.oldest_message_id, self.backfill_complete))
+            if commit:
+                self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error saving sync state: {str(e)}")
+            self.conn.rollback()
+            if not commit:
+                raise
+
+    def track(self, message_id: int):
+        """Advance the high-water marks past a stored message."""
+        if self.max_message_id is None or message_id > self.max_message_id:
+            self.max_message_id = message_id
+        if self.oldest_message_id is None or message_id < self.oldest_message_id:
+            self.oldest_message_id = message_id
+
+    def message_row(self, message) -> Optional[Tuple]:
+        """Database row for a message, or None if its sender is ignored."""
+        # sender_id is set even when the sender entity isn't cached (common for update events);
+        # for channel posts both may be None
+        sender_id = message.sender_id
+        sender_username = getattr(message.sender, 'username', None)
+        if sender_id in IGNORE_SENDER_IDS:
+            return None
+
+        # Handle media type
+        media_type = None
+        media_file_id = None
+        if message.media:
+            if hasattr(message.media, 'photo'):
+                media_type = 'photo'
+                media_file_id = str(message.media.photo.id)
+            elif hasattr(message.media, 'document'):
+                media_type = 'document'
+                media_file_id = str(message.media.document.id)
+
+        return (
+            message.id,
+            self.channel_id,
+            sender_id,
+            sender_username,
+            message.message,
+            message.reply_to.reply_to_msg_id if message.reply_to else None,
+            message.forward.from_id.user_id if message.forward and hasattr(message.forward.from_id, 'user_id') else None,
+            message.forward.from_name if message.forward else None,
+            media_type,
+            media_file_id,
+            message.date,
+            message.edit_date,
+            message.pinned
+        )
+
+    def load_backfill_ranges(self) -> List[BackfillRange]:
+        self.cursor.execute(BACKFILL_RANGES_SCHEMA)
+        self.cursor.execute("""
+            SELECT range_start, range_end, next_id, complete
+            FROM telegram_backfill_ranges
+            WHERE chat_id = %s
+            ORDER BY range_start DESC
+        """, (self.channel_id,))
+        ranges = [BackfillRange(*row) for row in self.cursor.fetchall()]
+        self.conn.commit()
+        return ranges
+
+    def plan_backfill_ranges(self, upper_id: int, count: int) -> List[BackfillRange]:
+        """Split message ids [1, upper_id) into `count` ranges and persist them."""
+        if upper_id <= 1:
+            return []
+        size = max(1, -(-(upper_id - 1) // count))
+        ranges = [
+            BackfillRange(start, min(start + size, upper_id), min(start + size, upper_id))
+            for start in range(1, upper_id, size)
+        ]
+        execute_values(self.cursor, """
+            INSERT INTO telegram_backfill_ranges (chat_id, range_start, range_end, next_id)
+            VALUES %s
+            ON CONFLICT (chat_id, range_start) DO NOTHING
+        """, [(self.channel_id, r.start, r.end, r.next_id) for r in ranges])
+        self.conn.commit()
+        logger.info(f"Planned {len(ranges)} backfill ranges of ~{size} ids below {upper_id}")
+        return sorted(ranges, key=lambda r: r.start, reverse=True)
+
+    def save_batch(self, items: List[Tuple[Optional[BackfillRange], object]], commit: bool = True):
+        """Insert a batch of messages and advance the sync state and range checkpoints in one transaction."""
+        messages = [message for _, message in items if message is not RANGE_DONE]
+        rows = [row for row in (self.message_row(message) for message in messages) if row]
+        try:
+            if rows:
+                execute_values(
+                    self.cursor, MESSAGE_INSERT + "ON CONFLICT (message_id, chat_id) DO NOTHING",
+                    rows, page_size=len(rows)
+                )
+            for message in messages:
+                self.track(message.id)
+
+            # Ranges are walked newest to oldest, so the lowest id written is the resume point
+            progress = {}
+            for backfill_range, message in items:
+                if backfill_range is None:
+                    if message is RANGE_DONE:
+                        self.backfill_complete = True
+                    continue
+                if message is RANGE_DONE:
+                    backfill_range.complete = True
+                else:
+                    backfill_range.next_id = min(backfill_range.next_id, message.id)
+                progress[backfill_range.start] = backfill_range
+            for backfill_range in progress.values():
+                self.cursor.execute("""
+                    UPDATE telegram_backfill_ranges
+                    SET next_id = %s, complete = %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE chat_id = %s AND range_start = %s
+                """, (backfill_range.next_id, backfill_range.complete, self.channel_id, backfill_range.start))
+
+            self.save_sync_state(commit=False)
+            if commit:
+                self.conn.commit()
+            return len(rows)
         except Exception as e:
-            logger.error(f"Error saving message {message.id}: {str(e)}")
+            logger.error(f"Error saving batch of {len(rows)} messages: {str(e)}")
             self.conn.rollback()
+            raise
+
+    async def write_messages(self, queue: asyncio.Queue) -> int:
+        """Consume (range, message) items from the queue, writing them in batches until a None sentinel."""
+        return await write_batches(queue, self.batch_size, self.save_batch)
+
+    async def history(self, client, start_id: int = 0, reverse: bool = False,
+                      wait_time: Optional[float] = None,
+                      backfill_range: Optional[BackfillRange] = None):
+        """Yield (range, message) items read from Telegram.
+
+        Walks newest to oldest below `start_id` (0 = from the newest message), or
+        with `reverse` oldest to newest above it; a backfill range also stops at
+        its lower bound. A flood wait too long for Telethon to sleep through
+        itself is slept here, exactly as long as Telegram asks, and reading
+        resumes after the last message read.
+        """
+        last_id = start_id
+        while True:
+            if reverse:
+                position = {'min_id': last_id, 'reverse': True}
+            else:
+                position = {'offset_id': last_id}
+                if backfill_range:
+                    position['min_id'] = backfill_range.start - 1
+            try:
+                async for message in client.iter_messages(
+                    self.channel_id, limit=None, wait_time=wait_time, **position
+                ):
+                    yield backfill_range, message
+                    last_id = message.id
+                break
+            except FloodWaitError as e:
+                logger.warning(f"Flood wait in {self.channel_id} after message {last_id}, sleeping {e.seconds}s")
+                await asyncio.sleep(e.seconds)
+        if backfill_range:
+            yield backfill_range, RANGE_DONE
+
+    async def read_messages(self, client, queue: asyncio.Queue, start_id: int = 0, reverse: bool = False,
+                            wait_time: Optional[float] = None,
+                            backfill_range: Optional[BackfillRange] = None):
+        """Read messages from Telegram into the writer queue."""
+        async for item in self.history(client, start_id, reverse, wait_time, backfill_range):
+            await queue.put(item)
+
+    async def run_pipeline(self, producers: List[Callable[[asyncio.Queue], Awaitable]]) -> int:
+        return await run_pipeline(producers, self.write_messages, self.queue_size)
+
+    async def with_history_session(self, client, work: Callable[..., Awaitable]):
+        """Run work(history_client, wait_time) in a takeout session when enabled, else on the client."""
+        if self.use_takeout:
+            try:
+                async with client.takeout(finalize=True, channels=True, megagroups=True) as takeout:
+                    return await work(takeout, self.takeout_wait_time)
+            except TakeoutInitDelayError as e:
+                logger.warning(
+                    f"Telegram requires waiting {e.seconds}s before a takeout session, "
+                    f"backfilling with the regular session instead"
+                )
+        return await work(client, None)
 
-    async def fetch_messages(self, backfill: bool = False):
-        """Fetch messages from Telegram channel"""
+    async def backfill_messages(self) -> int:
+        """Walk history below the oldest fetched message in a single stream."""
+        start_id = self.oldest_message_id or 0
+
+        async def produce(queue):
+            await self.with_history_session(
+                self.client, lambda history, wait_time: self.read_messages(history, queue, start_id, wait_time=wait_time)
+            )
+        return await self.run_pipeline([produce])
+
+    async def parallel_backfill(self, clients: List[TelegramClient]) -> int:
+        """Backfill id ranges concurrently, each session taking the next unfinished range.
+
+        Ranges are checkpointed individually, so an interrupted backfill resumes
+        every range where it stopped.
+        """
+        ranges = self.load_backfill_ranges()
+        if not ranges:
+            if self.oldest_message_id:
+                upper_id = self.oldest_message_id
+            else:
+                newest = await self.client.get_messages(self.channel_id, limit=1)
+                upper_id = newest[0].id + 1 if newest else 1
+            ranges = self.plan_backfill_ranges(upper_id, len(clients) * self.ranges_per_session)
+
+        pending: asyncio.Queue = asyncio.Queue()
+        for backfill_range in ranges:
+            if not backfill_range.complete:
+                pending.put_nowait(backfill_range)
+        logger.info(f"Backfilling {pending.qsize()} ranges with {len(clients)} sessions")
+
+        async def session_worker(client, queue):
+            async def work(history, wait_time):
+                while not pending.empty():
+                    backfill_range = pending.get_nowait()
+                    await self.read_messages(
+                        history, queue, backfill_range.next_id,
+                        wait_time=wait_time, backfill_range=backfill_range
+                    )
+            await self.with_history_session(client, work)
+
+        return await self.run_pipeline([
+            lambda queue, client=client: session_worker(client, queue) for client in clients
+        ])
+
+    async def connect_client(self, session: str) -> TelegramClient:
+        # Telethon sleeps through short flood waits on any request; longer ones raise, and
+        # history() sleeps them out and resumes after the last message read
+        client = TelegramClient(session, self.api_id, self.api_hash)
+        await client.start(phone=self.phone)
+
+        if not await client.is_user_authorized():
+            logger.info("Waiting for code... Check your Telegram app!")
+            await client.send_code_request(self.phone)
+            code = input('Enter the code you received: ')
+            await client.sign_in(self.phone, code)
+        return client
+
+    async def fetch_messages(self, backfill: bool = False, live: bool = False):
+        """Fetch messages from Telegram channel, then with `live` keep ingesting changes as they happen"""
         try:
             self.conn = get_db_connection()
             self.cursor = self.conn.cursor()
             
             # Create client and connect as user
-            self.client = TelegramClient('anon', self.api_id, self.api_hash)
-            await self.client.start(phone=self.phone)
-            
-            if not await self.client.is_user_authorized():
-                logger.info("Waiting for code... Check your Telegram app!")
-                await self.client.send_code_request(self.phone)
-                code = input('Enter the code you received: ')
-                await self.client.sign_in(self.phone, code)
+            self.client = await self.connect_client(self.sessions[0])
             
             logger.info(f"Connected to channel ID: {self.channel_id}")
             
-            # Get messages
+            self.load_sync_state()
             message_count = 0
-            async for message in self.client.iter_messages(self.channel_id, limit=None):
-                await self.save_message(message)
-                message_count += 1
-                if message_count % 100 == 0:
-                    logger.info(f"Processed {message_count} messages")
-                await asyncio.sleep(0.1)
+            tail = LiveTail([self], self.client, self.conn)
+            if live:
+                # Subscribe before catching up so nothing posted meanwhile is missed
+                tail.attach()
+
+            if self.max_message_id is not None:
+                # Only messages newer than the high-water mark, oldest first so the mark only moves forward
+                logger.info(f"Fetching messages newer than {self.max_message_id}")
+                message_count += await self.run_pipeline([
+                    lambda queue: self.read_messages(self.client, queue, self.max_message_id, reverse=True)
+                ])
+
+            if self.max_message_id is None or (backfill and not self.backfill_complete):
+                # Walk history newest to oldest, resuming below the oldest message already fetched
+                logger.info(f"Backfilling history before {self.oldest_message_id or 'the newest message'}")
+                if len(self.sessions) > 1 or self.load_backfill_ranges():
+                    for session in self.sessions[1:]:
+                        self.extra_clients.append(await self.connect_client(session))
+                    message_count += await self.parallel_backfill([self.client, *self.extra_clients])
+                else:
+                    message_count += await self.backfill_messages()
+                self.backfill_complete = True
+                self.save_sync_state()
                 
             logger.info(f"Completed processing {message_count} messages")
+            if live:
+                await tail.run()
             
         except Exception as e:
             logger.error(f"Error fetching messages: {str(e)}")
@@ -151,11 +482,275 @@ class TelegramMessageFetcher:
                 self.conn.close()
             if self.client:
                 await self.client.disconnect()
+            for client in self.extra_clients:
+                await client.disconnect()
+
+class MultiChannelFetcher:
+    """Fetches several chats over one Telegram client and one database connection.
+
+    Each chat keeps its own sync state through a TelegramMessageFetcher. Reads
+    are scheduled round-robin, at most `turn_size` messages per chat per turn,
+    so one chat's long backlog cannot starve the others. A single writer
+    commits every chat's messages and checkpoints together.
+    """
+
+    def __init__(self, channel_ids: List[int]):
+        self.fetchers = [TelegramMessageFetcher(channel_id) for channel_id in channel_ids]
+        self.turn_size = int(os.getenv('FETCH_TURN_SIZE', '100'))
+        self.client = None
+        self.conn = None
+        # Ranges left by an interrupted range-parallel backfill, per chat
+        self.backfill_ranges: Dict[int, List[BackfillRange]] = {}
+
+    def save_batch(self, items: List[Tuple[TelegramMessageFetcher, tuple]]) -> int:
+        """Write each chat's share of the batch, committing them all at once."""
+        by_channel = {}
+        for fetcher, item in items:
+            by_channel.setdefault(fetcher.channel_id, (fetcher, []))[1].append(item)
+        try:
+            saved = sum(
+                fetcher.save_batch(channel_items, commit=False) for fetcher, channel_items in by_channel.values()
+            )
+            self.conn.commit()
+            return saved
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    async def write_messages(self, queue: asyncio.Queue) -> int:
+        return await write_batches(queue, self.fetchers[0].batch_size, self.save_batch)
+
+    async def channel_reader(self, fetcher: TelegramMessageFetcher, client, wait_time: Optional[float],
+                             backfill: bool):
+        """A chat's new messages, then its history below the oldest fetched message if still needed.
+
+        A chat with backfill ranges resumes each unfinished range instead: after a
+        range-parallel backfill, oldest_message_id is only the lowest id any range
+        reached, and resuming below it would skip the rest of the upper ranges.
+        """
+        needs_backfill = fetcher.max_message_id is None or (backfill and not fetcher.backfill_complete)
+        if fetcher.max_message_id is not None:
+            async for item in fetcher.history(client, fetcher.max_message_id, reverse=True):
+                yield item
+        if needs_backfill:
+            ranges = self.backfill_ranges.get(fetcher.channel_id)
+            if ranges:
+                for backfill_range in ranges:
+                    if backfill_range.complete:
+                        continue
+                    async for item in fetcher.history(
+                        client, backfill_range.next_id, wait_time=wait_time, backfill_range=backfill_range
+                    ):
+                        yield item
+            else:
+                async for item in fetcher.history(client, fetcher.oldest_message_id or 0, wait_time=wait_time):
+                    yield item
+            yield None, RANGE_DONE
+
+    async def schedule(self, queue: asyncio.Queue, client, wait_time: Optional[float], backfill: bool):
+        """Queue messages from every chat in turns of at most turn_size each."""
+        active = deque(
+            (fetcher, self.channel_reader(fetcher, client, wait_time, backfill)) for fetcher in self.fetchers
+        )
+        while active:
+            fetcher, reader = active.popleft()
+            for _ in range(self.turn_size):
+                try:
+                    item = await reader.__anext__()
+                except StopAsyncIteration:
+                    break
+                await queue.put((fetcher, item))
+            else:
+                active.append((fetcher, reader))
+
+    async def fetch_messages(self, backfill: bool = False, live: bool = False):
+        first = self.fetchers[0]
+        try:
+            self.conn = get_db_connection()
+            cursor = self.conn.cursor()
+            for fetcher in self.fetchers:
+                fetcher.conn, fetcher.cursor = self.conn, cursor
+                fetcher.load_sync_state()
+                ranges = fetcher.load_backfill_ranges()
+                if ranges:
+                    self.backfill_ranges[fetcher.channel_id] = ranges
+                    logger.info(
+                        f"Resuming {sum(not r.complete for r in ranges)} unfinished backfill ranges "
+                        f"for {fetcher.channel_id}"
+                    )
+            if len(first.sessions) > 1:
+                logger.warning(
+                    f"Multi-channel mode fetches over one session; FETCH_SESSIONS {first.sessions[1:]} are unused"
+                )
+
+            self.client = await first.connect_client(first.sessions[0])
+            logger.info(f"Connected, fetching {len(self.fetchers)} channels")
+            tail = LiveTail(self.fetchers, self.client, self.conn)
+            if live:
+                tail.attach()
+
+            async def produce(queue):
+                await first.with_history_session(
+                    self.client, lambda history, wait_time: self.schedule(queue, history, wait_time, backfill)
+                )
+            message_count = await run_pipeline([produce], self.write_messages, first.queue_size)
+            logger.info(f"Completed processing {message_count} messages across {len(self.fetchers)} channels")
+            if live:
+                await tail.run()
+
+        except Exception as e:
+            logger.error(f"Error fetching messages: {str(e)}")
+            raise
+        finally:
+            if self.conn:
+                self.conn.close()
+            if self.client:
+                await self.client.disconnect()
+
+
+class LiveTail:
+    """Ingests new, edited and deleted messages from Telegram update events.
+
+    Events are queued as they arrive and written in micro-batches, flushed once
+    `flush_rows` events are waiting or `flush_ms` after the first one, whichever
+    comes first. New and edited messages are upserted; an edit that changes the
+    text sends the message back to the sentiment backlog with a fresh retry
+    budget, even if it had been dead-lettered. Deleted messages are removed.
+    """
+
+    def __init__(self, fetchers: List[TelegramMessageFetcher], client, conn):
+        self.fetchers = {fetcher.channel_id: fetcher for fetcher in fetchers}
+        self.client = client
+        self.conn = conn
+        self.flush_rows = int(os.getenv('FETCH_LIVE_FLUSH_ROWS', '100'))
+        self.flush_ms = float(os.getenv('FETCH_LIVE_FLUSH_MS', '250'))
+        # Unbounded: events keep arriving while the catch-up pipeline still owns the connection
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def attach(self):
+        chats = list(self.fetchers)
+        self.client.add_event_handler(self.on_message, events.NewMessage(chats=chats))
+        self.client.add_event_handler(self.on_message, events.MessageEdited(chats=chats))
+        self.client.add_event_handler(self.on_deleted, events.MessageDeleted(chats=chats))
+
+    async def on_message(self, event):
+        self.queue.put_nowait(('upsert', event.chat_id, event.message))
+
+    async def on_deleted(self, event):
+        # Telegram only says which chat a deletion came from for channels and supergroups
+        if event.chat_id in self.fetchers:
+            self.queue.put_nowait(('delete', event.chat_id, event.deleted_ids))
+
+    def save_events(self, batch: List[Tuple[str, int, object]]):
+        """Apply a micro-batch in one transaction, keeping only each message's final state."""
+        changes = {}
+        for kind, chat_id, payload in batch:
+            upserts, deleted = changes.setdefault(chat_id, ({}, set()))
+            if kind == 'upsert':
+                upserts[payload.id] = payload
+                deleted.discard(payload.id)
+            else:
+                for message_id in payload:
+                    upserts.pop(message_id, None)
+                    deleted.add(message_id)
+
+        cursor = self.conn.cursor()
+        try:
+            upserted = removed = 0
+            for chat_id, (upserts, deleted) in changes.items():
+                fetcher = self.fetchers[chat_id]
+                rows = [row for row in (fetcher.message_row(message) for message in upserts.values()) if row]
+                if rows:
+                    execute_values(cursor, MESSAGE_INSERT + """
+                        ON CONFLICT (message_id, chat_id) DO UPDATE SET
+                            content = EXCLUDED.content,
+                            media_type = EXCLUDED.media_type,
+                            media_file_id = EXCLUDED.media_file_id,
+                            edited_timestamp = EXCLUDED.edited_timestamp,
+                            is_pinned = EXCLUDED.is_pinned,
+                            sentiment_analyzed = telegram_messages.sentiment_analyzed
+                                AND telegram_messages.content IS NOT DISTINCT FROM EXCLUDED.content,
+                            sentiment_attempts = CASE
+                                WHEN telegram_messages.content IS NOT DISTINCT FROM EXCLUDED.content
+                                THEN telegram_messages.sentiment_attempts ELSE 0 END,
+                            sentiment_next_attempt_at = CASE
+                                WHEN telegram_messages.content IS NOT DISTINCT FROM EXCLUDED.content
+                                THEN telegram_messages.sentiment_next_attempt_at END
+                    """, rows, page_size=len(rows))
+                    upserted += len(rows)
+                if deleted:
+                    cursor.execute("""
+                        DELETE FROM telegram_messages
+                        WHERE chat_id = %s AND message_id = ANY(%s)
+                    """, (chat_id, list(deleted)))
+                    removed += cursor.rowcount
+                for message_id in upserts:
+                    fetcher.track(message_id)
+                fetcher.save_sync_state(commit=False)
+            self.conn.commit()
+            logger.info(f"Live: upserted {upserted} messages, deleted {removed}")
+        except Exception as e:
+            logger.error(f"Error saving live batch of {len(batch)} events: {str(e)}")
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    async def write_events(self):
+        """Flush queued events every flush_rows events or flush_ms, until a None sentinel."""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_ms / 1000
+            done = False
+            while len(batch) < self.flush_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+            await asyncio.to_thread(self.save_events, batch)
+            if done:
+                return
+
+    async def run(self):
+        """Write events until the client disconnects; a failed write stops the tail."""
+        logger.info(f"Live-tailing {len(self.fetchers)} channels")
+        writer = asyncio.create_task(self.write_events())
+        disconnected = asyncio.ensure_future(self.client.run_until_disconnected())
+        await asyncio.wait({writer, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if writer.done():
+            disconnected.cancel()
+            writer.result()
+            return
+        await self.queue.put(None)
+        await writer
+
+
+def channel_ids_from_env() -> List[int]:
+    """TARGET_CHANNEL_IDS (comma-separated), falling back to TARGET_CHANNEL_ID."""
+    ids = os.getenv('TARGET_CHANNEL_IDS') or os.getenv('TARGET_CHANNEL_ID', '')
+    return [int(channel_id) for channel_id in ids.split(',') if channel_id.strip()]
 
 async def main():
     try:
-        fetcher = TelegramMessageFetcher()
-        await fetcher.fetch_messages(backfill=True)
+        channel_ids = channel_ids_from_env()
+        if len(channel_ids) > 1:
+            fetcher = MultiChannelFetcher(channel_ids)
+        else:
+            fetcher = TelegramMessageFetcher(channel_ids[0] if channel_ids else None)
+        await fetcher.fetch_messages(
+            backfill=True, live=os.getenv('FETCH_LIVE', 'false').lower() == 'true'
+        )
     except Exception as e:
         logger.error(f"Main error: {str(e)}")
 
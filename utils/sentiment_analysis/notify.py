@@ -0,0 +1,81 @@
+import asyncio
+import logging
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from db.db_postgres import get_db_connection
+from sentiment_analysis.sources import NEW_ROW_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationListener:
+    """Dedicated autocommit connection that LISTENs on a channel and wakes asyncio waiters."""
+
+    def __init__(self, channel: str = NEW_ROW_CHANNEL):
+        self.channel = channel
+        self.conn = None
+
+    def connect(self):
+        self.conn = get_db_connection()
+        if self.conn is None:
+            raise psycopg2.OperationalError("could not connect to the database")
+        self.conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = self.conn.cursor()
+        cursor.execute(f"LISTEN {self.channel};")
+        cursor.close()
+        logger.info(f"Listening for notifications on {self.channel}")
+
+    def _drain(self) -> bool:
+        self.conn.poll()
+        received = bool(self.conn.notifies)
+        self.conn.notifies.clear()
+        return received
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for a notification. Returns True if one arrived.
+
+        A dropped connection is re-established; notifications sent meanwhile are
+        lost, so True is returned to make the caller look for work. While it can't
+        reconnect, this degrades to sleeping `timeout` seconds.
+        """
+        try:
+            if self.conn is None:
+                self.connect()
+                return True
+            return await self._wait(timeout)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            logger.warning(f"LISTEN connection lost ({str(e).strip()}), reconnecting")
+            self.close()
+            try:
+                self.connect()
+                return True
+            except psycopg2.Error as e:
+                logger.error(f"Could not re-establish LISTEN, polling every {timeout}s: {str(e).strip()}")
+                self.close()
+                await asyncio.sleep(timeout)
+                return False
+
+    async def _wait(self, timeout: float) -> bool:
+        if self._drain():
+            return True
+
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(self.conn.fileno(), readable.set)
+        try:
+            await asyncio.wait_for(readable.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(self.conn.fileno())
+        return self._drain()
+
+    def close(self):
+        if self.conn:
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+            self.conn = None
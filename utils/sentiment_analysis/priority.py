@@ -0,0 +1,49 @@
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+from sentiment_analysis.sources import SentimentSource
+
+
+@dataclass
+class PriorityClass:
+    name: str
+    # Guaranteed fraction of each claimed batch
+    share: float
+    # SQL predicate on the source table selecting the class
+    condition: str
+    # Claim the newest matching rows first, or the oldest
+    newest_first: bool = True
+
+
+def default_priority_classes(source: SentimentSource, live_window_seconds: int = 3600,
+                             bot_sender_ids: Sequence[int] = ()) -> List[PriorityClass]:
+    """Live rows first, then replies to the bot, then historical backfill.
+
+    The classes are disjoint, so each share really goes to its own rows; backfill
+    is claimed oldest first. Capacity a class leaves unused is offered to the
+    classes in priority order (see SentimentAnalyzer.claim_messages).
+    """
+    live_condition = f"{source.timestamp_column} >= NOW() - INTERVAL '{int(live_window_seconds)} seconds'"
+    classes = [PriorityClass(name='live', share=0.6, condition=live_condition)]
+    if bot_sender_ids and source.reply_condition:
+        bot_ids = ', '.join(str(int(sender_id)) for sender_id in bot_sender_ids)
+        classes.append(PriorityClass(
+            name='reply',
+            share=0.25,
+            condition=source.reply_condition.format(bot_ids=bot_ids)
+        ))
+    # COALESCE so rows where a condition is NULL (e.g. no timestamp) still land in backfill
+    backfill_condition = ' AND '.join(f"NOT COALESCE(({priority.condition}), FALSE)" for priority in classes)
+    classes.append(PriorityClass(
+        name='backfill', share=0.15, condition=backfill_condition, newest_first=False
+    ))
+    return classes
+
+
+def allocate_quotas(classes: List[PriorityClass], batch_size: int) -> Dict[str, int]:
+    """Split a batch between classes by share, giving every class at least one slot."""
+    total_share = sum(priority.share for priority in classes)
+    return {
+        priority.name: max(1, int(batch_size * priority.share / total_share))
+        for priority in classes
+    }
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to `capacity` units."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.available = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.refill_per_second
+
+    def consume(self, amount: float):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Token-bucket limiter for an API quota expressed in requests/min and tokens/min.
+
+    Callers `acquire` before each request with an estimate of the tokens it will use,
+    and report 429 responses via `backoff` so every caller pauses together.
+    """
+
+    def __init__(self, requests_per_minute: int = 3500, tokens_per_minute: int = 90000,
+                 max_backoff: float = 60.0):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.max_backoff = max_backoff
+        self.blocked_until = 0.0
+        self.consecutive_backoffs = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 1):
+        """Wait until a request using `tokens` tokens fits within the quota."""
+        async with self._lock:
+            while True:
+                wait = max(
+                    self.blocked_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(tokens),
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+
+    def backoff(self, retry_after: Optional[float] = None):
+        """Pause all callers after a 429, honouring Retry-After or backing off exponentially."""
+        self.consecutive_backoffs += 1
+        delay = retry_after if retry_after is not None else min(
+            self.max_backoff, 2 ** (self.consecutive_backoffs - 1)
+        )
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        logger.warning(f"Rate limited, backing off for {delay:.1f}s")
+
+    def success(self):
+        """Reset the exponential backoff after a successful request."""
+        self.consecutive_backoffs = 0
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for quota accounting (~4 characters per token)."""
+    return len(text) // 4 + 1
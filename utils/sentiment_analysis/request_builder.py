@@ -0,0 +1,140 @@
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from sentiment_analysis.few_shot import ExampleIndex, format_examples
+from sentiment_analysis.rate_limiter import estimate_tokens
+from sentiment_analysis.sources import WHITESPACE
+
+# Zero-width characters carry no sentiment but cost tokens
+INVISIBLE = re.compile('[\u200b\u200c\u2060\ufeff]')
+# Long runs of one symbol ("!!!!!!!!", "🚀🚀🚀🚀🚀🚀") are capped, keeping some emphasis
+LONG_REPEATS = re.compile(r'([^\w\s])\1{3,}')
+TRUNCATION_MARK = ' … '
+
+
+def canonical_prompt(prompt: str) -> str:
+    """Strip the source indentation and blank lines so the prompt is byte-identical and compact."""
+    return '\n'.join(line.strip() for line in prompt.strip().splitlines() if line.strip())
+
+
+def normalize_text(text: str) -> str:
+    """Normalize message text for the model without changing its meaning (case is kept)."""
+    text = INVISIBLE.sub('', unicodedata.normalize('NFKC', text))
+    text = LONG_REPEATS.sub(r'\1\1\1', text)
+    return WHITESPACE.sub(' ', text).strip()
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cap text at roughly max_tokens, keeping its start and end."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 3 // 4
+    tail = max_chars - head - len(TRUNCATION_MARK)
+    if tail <= 0:
+        # Too small a cap to keep both ends around the mark
+        return text[:max_chars]
+    return text[:head].rstrip() + TRUNCATION_MARK + text[-tail:].lstrip()
+
+
+@dataclass
+class SentimentRequest:
+    system_prompt: str
+    content: str
+    max_tokens: int
+    # Estimated prompt tokens as sent, and as they would have been without trimming
+    prompt_tokens: int
+    untrimmed_tokens: int
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.max_tokens
+
+
+class RequestBuilder:
+    """Builds compact single and batch scoring requests and keeps token accounting."""
+
+    def __init__(self, system_prompt: str, batch_system_prompt: str, max_content_tokens: int = 256,
+                 example_index: Optional[ExampleIndex] = None, few_shot_k: int = 4):
+        self.raw_prompts = (system_prompt, batch_system_prompt)
+        self.system_prompt = canonical_prompt(system_prompt)
+        self.batch_system_prompt = canonical_prompt(batch_system_prompt)
+        if max_content_tokens < 1:
+            raise ValueError(f"max_content_tokens must be at least 1, got {max_content_tokens}")
+        self.max_content_tokens = max_content_tokens
+        # Labelled examples most similar to the messages are appended after the shared prompt prefix
+        self.example_index = example_index
+        self.few_shot_k = few_shot_k
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.untrimmed_tokens = 0
+        self.truncated = 0
+
+    def _record(self, request: SentimentRequest) -> SentimentRequest:
+        self.requests += 1
+        self.prompt_tokens += request.prompt_tokens
+        self.untrimmed_tokens += request.untrimmed_tokens
+        return request
+
+    def _with_examples(self, prompt: str, texts: Sequence[str]) -> str:
+        if not self.example_index:
+            return prompt
+        examples = self.example_index.most_relevant(texts, self.few_shot_k)
+        return f"{prompt}\n{format_examples(examples)}" if examples else prompt
+
+    def build_single(self, text: str) -> SentimentRequest:
+        content = self._prepare(text)
+        system_prompt = self._with_examples(self.system_prompt, [text])
+        return self._record(SentimentRequest(
+            system_prompt=system_prompt,
+            content=content,
+            max_tokens=100,
+            prompt_tokens=estimate_tokens(system_prompt) + estimate_tokens(content),
+            untrimmed_tokens=(
+                estimate_tokens(self.raw_prompts[0]) + estimate_tokens(system_prompt)
+                - estimate_tokens(self.system_prompt) + estimate_tokens(text)
+            )
+        ))
+
+    def build_batch(self, texts: List[str]) -> SentimentRequest:
+        content = json.dumps(
+            [{"id": index, "text": self._prepare(text)} for index, text in enumerate(texts)],
+            ensure_ascii=False, separators=(',', ':')
+        )
+        # Serialized like the payload, so the savings measure the trimming alone
+        untrimmed = json.dumps(
+            [{"id": index, "text": text} for index, text in enumerate(texts)],
+            ensure_ascii=False, separators=(',', ':')
+        )
+        system_prompt = self._with_examples(self.batch_system_prompt, texts)
+        return self._record(SentimentRequest(
+            system_prompt=system_prompt,
+            content=content,
+            max_tokens=60 * len(texts) + 20,
+            prompt_tokens=estimate_tokens(system_prompt) + estimate_tokens(content),
+            untrimmed_tokens=(
+                estimate_tokens(self.raw_prompts[1]) + estimate_tokens(system_prompt)
+                - estimate_tokens(self.batch_system_prompt) + estimate_tokens(untrimmed)
+            )
+        ))
+
+    def _prepare(self, text: str) -> str:
+        prepared = normalize_text(text)
+        truncated = truncate_tokens(prepared, self.max_content_tokens)
+        if truncated is not prepared:
+            self.truncated += 1
+        return truncated
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        return {
+            'requests': self.requests,
+            'prompt_tokens': self.prompt_tokens,
+            'untrimmed_tokens': self.untrimmed_tokens,
+            'saved_ratio': (
+                1 - self.prompt_tokens / self.untrimmed_tokens if self.untrimmed_tokens else None
+            ),
+            'truncated_messages': self.truncated,
+        }
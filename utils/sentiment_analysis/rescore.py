@@ -0,0 +1,253 @@
+"""Background re-scoring of rows scored by an older model version.
+
+Walks each source table in primary-key order, re-scoring analyzed rows whose
+sentiment_model_version differs from the current one, or that were scored by a
+local head other than the current one. Progress is checkpointed per (table,
+version) so the job resumes where it stopped, and it runs with its
+own small request budget and steps aside whenever live rows are waiting, so the
+main analyzer is never starved.
+
+    python -m sentiment_analysis.rescore
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from db.db_postgres import get_db_connection
+from sentiment_analysis.core import (SentimentAnalyzer, WorkItem, analyzer_from_env,
+                                     setup_database, sources_from_env)
+from sentiment_analysis.sources import SentimentSource
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+RESCORE_CHECKPOINT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sentiment_rescore_checkpoints (
+        source_table TEXT,
+        model_version TEXT,
+        last_key TEXT,
+        rescored BIGINT NOT NULL DEFAULT 0,
+        failed BIGINT NOT NULL DEFAULT 0,
+        completed BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (source_table, model_version)
+    );
+"""
+
+
+class RescoreJob:
+    """Re-scores stale rows in key order, one checkpointed batch at a time."""
+
+    def __init__(self, analyzer: SentimentAnalyzer, batch_size: int = 100,
+                 pause_seconds: float = 1.0, live_backlog_wait: float = 30.0):
+        self.analyzer = analyzer
+        self.batch_size = batch_size
+        # Pause between batches, on top of the analyzer's own rate limit
+        self.pause_seconds = pause_seconds
+        # How long to step aside when the live analyzer has unscored rows waiting
+        self.live_backlog_wait = live_backlog_wait
+
+    @property
+    def local_head_source(self) -> Optional[str]:
+        local_scorer = self.analyzer.local_scorer
+        return local_scorer.score_source if local_scorer else None
+
+    @property
+    def checkpoint_version(self) -> str:
+        """Checkpoint key: the model version, plus the local head whose rows are current."""
+        if self.local_head_source:
+            return f"{self.analyzer.model_version}|{self.local_head_source}"
+        return self.analyzer.model_version
+
+    def load_checkpoint(self, conn, source: SentimentSource) -> Optional[dict]:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT last_key, rescored, failed, completed
+                FROM sentiment_rescore_checkpoints
+                WHERE source_table = %s AND model_version = %s
+            """, (source.table, self.checkpoint_version))
+            row = cursor.fetchone()
+            conn.commit()
+        finally:
+            cursor.close()
+        if not row:
+            return None
+        return {
+            'last_key': json.loads(row[0]) if row[0] else None,
+            'rescored': row[1],
+            'failed': row[2],
+            'completed': row[3],
+        }
+
+    def save_checkpoint(self, conn, source: SentimentSource, checkpoint: dict):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO sentiment_rescore_checkpoints (
+                    source_table, model_version, last_key, rescored, failed, completed
+                ) VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (source_table, model_version) DO UPDATE SET
+                    last_key = EXCLUDED.last_key,
+                    rescored = EXCLUDED.rescored,
+                    failed = EXCLUDED.failed,
+                    completed = EXCLUDED.completed,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (
+                source.table, self.checkpoint_version,
+                json.dumps(checkpoint['last_key']) if checkpoint['last_key'] is not None else None,
+                checkpoint['rescored'], checkpoint['failed'], checkpoint['completed']
+            ))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def live_backlog_waiting(self, conn) -> bool:
+        """Whether any source has unanalyzed rows the live analyzer could claim now."""
+        cursor = conn.cursor()
+        try:
+            for source in self.analyzer.sources:
+                cursor.execute(f"""
+                    SELECT EXISTS (
+                        SELECT 1 FROM {source.table}
+                        WHERE sentiment_analyzed = FALSE
+                        AND {source.content_column} IS NOT NULL
+                        AND {source.content_column} != ''
+                        AND sentiment_attempts < %s
+                        AND (sentiment_next_attempt_at IS NULL OR sentiment_next_attempt_at <= NOW())
+                    )
+                """, (self.analyzer.max_attempts,))
+                if cursor.fetchone()[0]:
+                    conn.commit()
+                    return True
+            conn.commit()
+            return False
+        finally:
+            cursor.close()
+
+    def fetch_stale(self, conn, source: SentimentSource, last_key: Optional[list]) -> List[WorkItem]:
+        """Next batch of analyzed rows after `last_key` that carry a different model version or local head."""
+        after, params = '', [self.analyzer.model_version, self.local_head_source]
+        if last_key is not None:
+            placeholders = ', '.join(f"%s::{key_type}" for key_type in source.key_types)
+            after = f"AND ({source.key_list}) > ({placeholders})"
+            params.extend(last_key)
+        params.append(self.batch_size)
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT {source.key_list}, {source.content_column}
+                FROM {source.table}
+                WHERE sentiment_analyzed = TRUE
+                AND (sentiment_model_version IS DISTINCT FROM %s
+                     OR (sentiment_score_source LIKE 'local_head:%%'
+                         AND sentiment_score_source IS DISTINCT FROM %s))
+                AND {source.content_column} IS NOT NULL
+                AND {source.content_column} != ''
+                {after}
+                ORDER BY {source.key_list}
+                LIMIT %s
+            """, params)
+            rows = [(tuple(row[:-1]), row[-1]) for row in cursor.fetchall()]
+            conn.commit()
+            return rows
+        finally:
+            cursor.close()
+
+    async def rescore_source(self, conn, source: SentimentSource):
+        checkpoint = self.load_checkpoint(conn, source) or {
+            'last_key': None, 'rescored': 0, 'failed': 0, 'completed': False
+        }
+        if checkpoint['completed']:
+            logger.info(f"{source.table} already re-scored for {self.checkpoint_version}")
+            return
+        logger.info(
+            f"Re-scoring {source.table} for {self.checkpoint_version}, resuming after {checkpoint['last_key']}"
+        )
+
+        while True:
+            if self.live_backlog_waiting(conn):
+                logger.info(f"Live backlog waiting, pausing re-scoring for {self.live_backlog_wait}s")
+                await asyncio.sleep(self.live_backlog_wait)
+                continue
+
+            messages = self.fetch_stale(conn, source, checkpoint['last_key'])
+            if not messages:
+                checkpoint['completed'] = True
+                self.save_checkpoint(conn, source, checkpoint)
+                logger.info(
+                    f"Finished re-scoring {source.table}: {checkpoint['rescored']} rows, "
+                    f"{checkpoint['failed']} left on their old version"
+                )
+                return
+
+            score_sources = {}
+            scored = await self.analyzer.score_messages(messages, conn, score_sources)
+            self.analyzer.write_scores(conn, source, scored, score_sources)
+
+            # Rows that fail keep their previous scores; restarting the job for this version retries them
+            checkpoint['last_key'] = list(messages[-1][0])
+            checkpoint['rescored'] += len(scored)
+            checkpoint['failed'] += len(messages) - len(scored)
+            self.save_checkpoint(conn, source, checkpoint)
+
+            await asyncio.sleep(self.pause_seconds)
+
+    async def run(self, sources: List[SentimentSource], restart: bool = False):
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(RESCORE_CHECKPOINT_SCHEMA)
+            if restart:
+                cursor.execute("""
+                    DELETE FROM sentiment_rescore_checkpoints WHERE model_version = %s
+                """, (self.checkpoint_version,))
+            conn.commit()
+            cursor.close()
+
+            for source in sources:
+                await self.rescore_source(conn, source)
+        finally:
+            conn.close()
+
+
+async def main():
+    sources = sources_from_env()
+    conn = get_db_connection()
+    try:
+        setup_database(conn, sources)
+    finally:
+        conn.close()
+
+    # Same configuration as live scoring, so the model versions match, but with
+    # a deliberately small slice of the provider budget; live scoring keeps the rest
+    analyzer = analyzer_from_env(
+        sources=sources,
+        max_concurrency=int(os.getenv('SENTIMENT_RESCORE_MAX_CONCURRENCY', '2')),
+        requests_per_minute=int(os.getenv('SENTIMENT_RESCORE_REQUESTS_PER_MINUTE', '300')),
+        tokens_per_minute=int(os.getenv('SENTIMENT_RESCORE_TOKENS_PER_MINUTE', '10000'))
+    )
+    job = RescoreJob(
+        analyzer,
+        batch_size=int(os.getenv('SENTIMENT_RESCORE_BATCH_SIZE', '100')),
+        pause_seconds=float(os.getenv('SENTIMENT_RESCORE_PAUSE_SECONDS', '1')),
+        live_backlog_wait=float(os.getenv('SENTIMENT_RESCORE_LIVE_WAIT_SECONDS', '30'))
+    )
+    logger.info(f"Re-scoring rows not produced by {analyzer.model_version}")
+    try:
+        await job.run(sources, restart=os.getenv('SENTIMENT_RESCORE_RESTART', 'false').lower() == 'true')
+    finally:
+        await analyzer.backend.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
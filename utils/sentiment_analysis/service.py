@@ -0,0 +1,204 @@
+"""Local HTTP sentiment scoring service.
+
+One process owns the analyzer, so the bot and the backlog workers share a
+single cache, rate limiter and quota instead of each running their own.
+
+    POST /score        {"text": "..."}            -> {"scores": {...} | null, "score_source": ...}
+    POST /score/batch  {"texts": ["...", ...]}    -> {"scores": [{...} | null, ...], "score_sources": [...]}
+    GET  /health                                  -> counters
+
+Requests arriving within a short window are merged into one scoring batch, and
+identical texts (after normalization) waiting or in flight share one result.
+
+    python -m sentiment_analysis.service
+"""
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from db.db_postgres import get_db_connection
+from sentiment_analysis.cache import content_hash
+from sentiment_analysis.core import SentimentAnalyzer, analyzer_from_env
+from sentiment_analysis.sources import SENTIMENT_KEYS, Scores
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+
+def scores_to_json(scores: Optional[Scores]) -> Optional[dict]:
+    return dict(zip(SENTIMENT_KEYS, scores)) if scores else None
+
+
+class BatchCoalescer:
+    """Merges concurrent scoring requests into analyzer batches.
+
+    A batch is flushed when it reaches max_batch texts or max_wait_ms after its
+    first text arrived, whichever comes first.
+    """
+
+    def __init__(self, analyzer: SentimentAnalyzer, conn, max_batch: int = 200, max_wait_ms: float = 20):
+        self.analyzer = analyzer
+        self.conn = conn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        # Text hash -> future for every text queued or being scored
+        self.futures: Dict[str, asyncio.Future] = {}
+        self.queue: Dict[str, str] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks = set()
+        self.requested = 0
+        self.coalesced = 0
+        self.batches = 0
+
+    def stats(self) -> dict:
+        return {
+            'requested': self.requested,
+            'coalesced': self.coalesced,
+            'batches': self.batches,
+            'queued': len(self.queue),
+            'in_flight': len(self.futures),
+        }
+
+    async def score(self, texts: Sequence[str]) -> List[Tuple[Optional[Scores], Optional[str]]]:
+        """(scores, score source) for each text; (None, None) for blank or unscorable texts."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            if not text or not text.strip():
+                futures.append(None)
+                continue
+            self.requested += 1
+            text_hash = content_hash(text, self.analyzer.model_version)
+            future = self.futures.get(text_hash)
+            if future is None:
+                future = self.futures[text_hash] = loop.create_future()
+                self.queue[text_hash] = text
+            else:
+                self.coalesced += 1
+            futures.append(future)
+
+        if len(self.queue) >= self.max_batch:
+            self.flush()
+        elif self.queue and self.timer is None:
+            self.timer = loop.call_later(self.max_wait, self.flush)
+
+        return [await future if future else (None, None) for future in futures]
+
+    def flush(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        if not self.queue:
+            return
+        batch, self.queue = self.queue, {}
+        self.batches += 1
+        task = asyncio.ensure_future(self._score_batch(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _score_batch(self, batch: Dict[str, str]):
+        score_sources = {}
+        try:
+            scored = await self.analyzer.score_messages(list(batch.items()), self.conn, score_sources)
+            error = None
+        except Exception as e:
+            logger.error(f"Error scoring coalesced batch: {str(e)}")
+            scored, error = {}, e
+        for text_hash in batch:
+            future = self.futures.pop(text_hash)
+            if future.done():
+                continue
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result((scored.get(text_hash), score_sources.get(text_hash)))
+
+
+class ScoringService:
+    """HTTP handlers around one shared analyzer.
+
+    The analyzer is built in on_startup rather than passed in, so its
+    semaphores and locks are created on the loop the app actually runs on.
+    """
+
+    def __init__(self, analyzer_factory: Callable[[], SentimentAnalyzer] = analyzer_from_env,
+                 max_batch: int = 200, max_wait_ms: float = 20):
+        self.analyzer_factory = analyzer_factory
+        self.analyzer: Optional[SentimentAnalyzer] = None
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.conn = None
+        self.coalescer: Optional[BatchCoalescer] = None
+
+    async def handle_score(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        [(scores, score_source)] = await self.coalescer.score([body.get('text') or ''])
+        return web.json_response({
+            "scores": scores_to_json(scores),
+            "score_source": score_source,
+            "model_version": self.analyzer.model_version,
+        })
+
+    async def handle_batch(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        texts = body.get('texts')
+        if not isinstance(texts, list):
+            raise web.HTTPBadRequest(text="expected {\"texts\": [...]}")
+        scored = await self.coalescer.score([str(text or '') for text in texts])
+        return web.json_response({
+            "scores": [scores_to_json(scores) for scores, _ in scored],
+            "score_sources": [score_source for _, score_source in scored],
+            "model_version": self.analyzer.model_version,
+        })
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "model_version": self.analyzer.model_version,
+            "coalescer": self.coalescer.stats(),
+            "cache": self.analyzer.cache.stats(),
+            "fast_path": self.analyzer.fast_path_count,
+            "local_head": self.analyzer.local_head_count,
+            "cascade": self.analyzer.escalation_stats(),
+            "tokens": self.analyzer.token_stats(),
+        })
+
+    async def on_startup(self, app: web.Application):
+        self.analyzer = self.analyzer_factory()
+        self.conn = get_db_connection()
+        self.coalescer = BatchCoalescer(self.analyzer, self.conn, self.max_batch, self.max_wait_ms)
+
+    async def on_cleanup(self, app: web.Application):
+        if self.analyzer:
+            await self.analyzer.backend.close()
+        if self.conn:
+            self.conn.close()
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/score', self.handle_score)
+        app.router.add_post('/score/batch', self.handle_batch)
+        app.router.add_get('/health', self.handle_health)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+def main():
+    service = ScoringService(
+        max_batch=int(os.getenv('SENTIMENT_SERVICE_MAX_BATCH', '200')),
+        max_wait_ms=float(os.getenv('SENTIMENT_SERVICE_MAX_WAIT_MS', '20'))
+    )
+    web.run_app(
+        service.build_app(),
+        host=os.getenv('SENTIMENT_SERVICE_HOST', '127.0.0.1'),
+        port=int(os.getenv('SENTIMENT_SERVICE_PORT', '8790'))
+    )
+
+
+if __name__ == "__main__":
+    main()
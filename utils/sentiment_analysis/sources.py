@@ -0,0 +1,128 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+# Shared by every module that handles scores; keep this module free of third-party imports
+# so the lightweight client can use it too.
+SENTIMENT_KEYS = ('positive', 'negative', 'helpful', 'sarcastic')
+Scores = Tuple[float, float, float, float]
+
+WHITESPACE = re.compile(r'\s+')
+
+NEW_ROW_CHANNEL = 'sentiment_backlog'
+
+
+def new_row_trigger(table: str) -> str:
+    """Trigger notifying NEW_ROW_CHANNEL after inserts into `table`.
+
+    Statement-level so a bulk insert of thousands of rows sends one wake-up, not thousands.
+    """
+    return f"""
+        CREATE OR REPLACE FUNCTION notify_sentiment_backlog() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{NEW_ROW_CHANNEL}', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS {table}_notify_new ON {table};
+        CREATE TRIGGER {table}_notify_new
+            AFTER INSERT ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_sentiment_backlog();
+    """
+
+
+# Values of sentiment_score_source, recording what produced a row's scores.
+# A local head writes 'local_head:<head fingerprint>' (see LocalScorer.score_source).
+SCORE_SOURCE_MODEL = 'model'
+SCORE_SOURCE_CACHE = 'cache'
+SCORE_SOURCE_FAST_PATH = 'fast_path'
+# Scores that came from the model itself, directly or through the content cache
+MODEL_SCORE_SOURCES = (SCORE_SOURCE_MODEL, SCORE_SOURCE_CACHE)
+
+
+@dataclass
+class SentimentSource:
+    """Adapter describing how to score the rows of one table.
+
+    Every source table gets the same sentiment_* score and work-queue columns,
+    so the analyzer can claim, write back and retry rows without knowing which
+    table they came from.
+    """
+    table: str
+    # Primary key columns and their Postgres types (used to cast VALUES lists)
+    key_columns: Tuple[str, ...]
+    key_types: Tuple[str, ...]
+    content_column: str
+    timestamp_column: str
+    # Optional predicate marking replies to the bot; `{bot_ids}` is filled with the bot's sender ids
+    reply_condition: Optional[str] = None
+
+    @property
+    def key_list(self) -> str:
+        return ', '.join(self.key_columns)
+
+    def key_join(self, left: str, right: str) -> str:
+        return ' AND '.join(f"{left}.{column} = {right}.{column}" for column in self.key_columns)
+
+    def key_template(self, extra: str = '') -> str:
+        """execute_values template for rows of key columns followed by `extra` placeholders."""
+        placeholders = [f"%s::{key_type}" for key_type in self.key_types]
+        if extra:
+            placeholders.append(extra)
+        return f"({', '.join(placeholders)})"
+
+    def setup_sql(self) -> str:
+        return f"""
+            ALTER TABLE {self.table}
+            ADD COLUMN IF NOT EXISTS sentiment_positive FLOAT,
+            ADD COLUMN IF NOT EXISTS sentiment_negative FLOAT,
+            ADD COLUMN IF NOT EXISTS sentiment_helpful FLOAT,
+            ADD COLUMN IF NOT EXISTS sentiment_sarcastic FLOAT,
+            ADD COLUMN IF NOT EXISTS sentiment_analyzed BOOLEAN DEFAULT FALSE,
+            ADD COLUMN IF NOT EXISTS sentiment_model_version TEXT,
+            ADD COLUMN IF NOT EXISTS sentiment_score_source TEXT,
+            ADD COLUMN IF NOT EXISTS sentiment_claimed_by TEXT,
+            ADD COLUMN IF NOT EXISTS sentiment_claimed_at TIMESTAMP WITH TIME ZONE,
+            ADD COLUMN IF NOT EXISTS sentiment_attempts INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS sentiment_next_attempt_at TIMESTAMP WITH TIME ZONE;
+
+            CREATE INDEX IF NOT EXISTS idx_{self.table}_sentiment_unanalyzed
+                ON {self.table}({self.timestamp_column} DESC) WHERE sentiment_analyzed = FALSE;
+            {new_row_trigger(self.table)}
+        """
+
+
+TELEGRAM_MESSAGES = SentimentSource(
+    table='telegram_messages',
+    key_columns=('message_id', 'chat_id'),
+    key_types=('bigint', 'bigint'),
+    content_column='content',
+    timestamp_column='timestamp',
+    reply_condition="""EXISTS (
+        SELECT 1 FROM telegram_messages AS parent
+        WHERE parent.chat_id = telegram_messages.chat_id
+        AND parent.message_id = telegram_messages.reply_to_message_id
+        AND parent.sender_id IN ({bot_ids})
+    )"""
+)
+
+MENTIONED_TWEETS = SentimentSource(
+    table='mentioned_tweets',
+    key_columns=('id',),
+    key_types=('text',),
+    content_column='text',
+    timestamp_column='created_at'
+)
+
+TWEET_REPLIES = SentimentSource(
+    table='tweet_replies',
+    key_columns=('id',),
+    key_types=('text',),
+    content_column='text',
+    timestamp_column='created_at'
+)
+
+SOURCES: Dict[str, SentimentSource] = {
+    source.table: source for source in (TELEGRAM_MESSAGES, MENTIONED_TWEETS, TWEET_REPLIES)
+}
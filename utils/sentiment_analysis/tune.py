@@ -1,6 +1,6 @@
 import json
 import os
-from dataclasses import asdict, dataclass
+from dataclasses import asdict
 from typing import Dict, List, Optional, Tuple
 
 import ipywidgets as widgets
@@ -8,18 +8,7 @@ import pandas as pd
 from IPython.display import HTML, clear_output, display
 
 from db.db_postgres import get_db_connection
-
-
-@dataclass
-class SentimentExample:
-    content: str
-    positive: float
-    negative: float
-    helpful: float
-    sarcastic: float
-    category: str
-    message_id: Optional[int] = None
-    notes: Optional[str] = None
+from sentiment_analysis.few_shot import ExampleIndex, SentimentExample
 
 class SentimentTuningNotebook:
     def __init__(self, examples_file: str = 'sentiment_examples.json'):
@@ -234,8 +223,12 @@ class SentimentTuningNotebook:
         self.examples.append(example)
         self.save_examples()
     
-    def generate_system_prompt(self) -> str:
-        """Generate the complete system prompt with examples."""
+    def generate_system_prompt(self, messages: Optional[List[str]] = None, k: int = 4) -> str:
+        """Generate the complete system prompt with examples.
+
+        With `messages`, only the k saved examples most similar to them are included
+        (the same retrieval the analyzer uses); otherwise the first three per category.
+        """
         base_prompt = """Analyze the sentiment of the following message and return a JSON object with these scores:
 - positive (0-1): How positive the message is
 - negative (0-1): How negative the message is
@@ -247,8 +240,11 @@ Examples of different message types and their scores:"""
         categories = ['positive', 'negative', 'helpful', 'sarcastic']
         examples_text = []
         
+        relevant = ExampleIndex(self.examples).most_relevant(messages, k) if messages else None
         for category in categories:
-            examples = [ex for ex in self.examples if ex.category == category]
+            examples = [
+                ex for ex in (relevant if relevant is not None else self.examples) if ex.category == category
+            ]
             if examples:
                 examples_text.append(f"\n{category.upper()} EXAMPLES:")
                 for ex in examples[:3]: